@@ -0,0 +1,330 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sorter_engine import (
+    DUPLICATE_MODES, SNIFF_MODES, ExtensionClassifier, NameRegistry, ScanCache, ScanRules, ContentSniffer,
+    default_folder_lists, destination_excludes, iter_files, build_preview, sort_files, read_journal,
+    journal_undo_pairs, undo_moves,
+)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PHASES = ["scan", "plan", "plan_warm", "move", "undo"]
+UNKNOWN_EXTENSIONS = ["", "dat", "tmp", "bin", "part"]
+
+def parse_mix(text: str, folder_lists: dict):
+    # "Images=3,Documents=1" -> category weights; unnamed categories get 0,
+    # an empty spec weights every category equally
+    if not text:
+        return {cat: 1.0 for cat in folder_lists}
+    mix = {}
+    for part in text.split(","):
+        cat, _, weight = part.partition("=")
+        cat = cat.strip()
+        if cat not in folder_lists:
+            raise ValueError(f"Unknown category in --mix: {cat}")
+        mix[cat] = float(weight or 1)
+    return mix
+
+def parse_sizes(text: str):
+    # fixed:N, uniform:MIN:MAX or lognormal:MU:SIGMA (of ln bytes), capped at 1 GiB
+    kind, _, rest = text.partition(":")
+    args = [float(a) for a in rest.split(":") if a]
+    if kind == "fixed" and len(args) == 1:
+        return lambda rng: int(args[0])
+    if kind == "uniform" and len(args) == 2:
+        return lambda rng: rng.randint(int(args[0]), int(args[1]))
+    if kind == "lognormal" and len(args) == 2:
+        return lambda rng: min(int(rng.lognormvariate(args[0], args[1])), 1 << 30)
+    raise ValueError(f"Bad size distribution: {text}")
+
+def generate_tree(root: Path, files: int, depth: int, fanout: int, mix: dict, unknown_ratio: float,
+                  dup_ratio: float, size_of, seed: int, folder_lists: dict):
+    # the same arguments and seed always give the same tree. Only the first
+    # 4 KiB of each file is written; the rest is a sparse tail, so large
+    # size distributions do not need the disk space or the write time.
+    rng = random.Random(seed)
+    dirs = [root]
+    level = [root]
+    for _ in range(depth):
+        level = [d / f"d{i}" for d in level for i in range(fanout)]
+        dirs.extend(level)
+    for d in dirs:
+        d.mkdir(parents=True, exist_ok=True)
+    cats = [c for c, w in mix.items() if w > 0]
+    weights = [mix[c] for c in cats]
+    names = []
+    total_bytes = 0
+    for i in range(files):
+        if names and rng.random() < dup_ratio:
+            name = rng.choice(names)
+        else:
+            if rng.random() < unknown_ratio:
+                ext = rng.choice(UNKNOWN_EXTENSIONS)
+            else:
+                ext = rng.choice(folder_lists[rng.choices(cats, weights)[0]])
+            name = f"f{i}.{ext}" if ext else f"f{i}"
+            names.append(name)
+        path = rng.choice(dirs) / name
+        if path.exists():
+            path = path.with_name(f"{i}_{name}")
+        size = max(0, size_of(rng))
+        head = min(size, 4096)
+        with open(path, "wb") as f:
+            f.write(rng.getrandbits(head * 8).to_bytes(head, "little") if head else b"")
+            if size > head:
+                f.truncate(size)
+        total_bytes += size
+    # backdated so the scan cache treats the folders as settled
+    old = time.time() - 3600
+    for d in dirs:
+        os.utime(d, (old, old))
+    return {"files": files, "dirs": len(dirs), "bytes": total_bytes}
+
+def read_proc_io():
+    # read/write syscall counters; Linux only
+    try:
+        with open("/proc/self/io", "r") as f:
+            return {k: int(v) for k, v in (line.split(":") for line in f)}
+    except (OSError, ValueError):
+        return None
+
+def reset_peak_rss():
+    # writing 5 to clear_refs resets VmHWM, so each phase gets its own peak
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_kb(reset_ok: bool):
+    if reset_ok:
+        try:
+            with open("/proc/self/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+    if resource is not None:
+        # lifetime peak when it cannot be reset; ru_maxrss is bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak
+    return None
+
+def measure(fn):
+    # runs fn() -> item count and returns its metrics
+    reset_ok = reset_peak_rss()
+    io_before = read_proc_io()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF) if resource is not None else None
+    start = time.perf_counter()
+    count = fn()
+    seconds = time.perf_counter() - start
+    result = {"items": count, "seconds": round(seconds, 6),
+              "items_per_sec": round(count / seconds, 1) if seconds > 0 else None,
+              "peak_rss_kb": peak_rss_kb(reset_ok)}
+    io_after = read_proc_io()
+    if io_before is not None and io_after is not None:
+        result["read_syscalls"] = io_after["syscr"] - io_before["syscr"]
+        result["write_syscalls"] = io_after["syscw"] - io_before["syscw"]
+    if usage_before is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        result["cpu_seconds"] = round(usage.ru_utime + usage.ru_stime - usage_before.ru_utime
+                                      - usage_before.ru_stime, 6)
+        result["context_switches"] = (usage.ru_nvcsw + usage.ru_nivcsw
+                                      - usage_before.ru_nvcsw - usage_before.ru_nivcsw)
+    return result
+
+def run_once(args, workdir: Path, seed: int):
+    folder_lists = default_folder_lists()
+    categories = set(folder_lists)
+    src = workdir / "src"
+    dst = Path(args.dest_dir) / f"dst-{seed}" if args.dest_dir else workdir / "dst"
+    tree = generate_tree(src, args.files, args.depth, args.fanout, parse_mix(args.mix, folder_lists),
+                         args.unknown_ratio, args.dup_ratio, parse_sizes(args.sizes), seed, folder_lists)
+    log_lines = []
+    log = log_lines.append
+    classifier = ExtensionClassifier(folder_lists, categories)
+    sniffer = None if args.sniff == "off" else ContentSniffer(classifier, args.sniff, max(4, args.workers), None)
+    cache = ScanCache(folder_lists, str(workdir / "scan_cache.json"), keep_all=sniffer is not None) \
+        if args.scan_cache else None
+    state = {}
+
+    def rules():
+        return ScanRules([src], destination_excludes([src], dst, folder_lists))
+
+    def scan():
+        return sum(1 for root in [src] for _ in iter_files(root))
+
+    def plan(cache):
+        state["registry"] = NameRegistry()
+        state["plan"] = build_preview([src], dst, folder_lists, categories, classifier, args.workers, args.mode,
+                                      state["registry"], cache, None, rules(), sniffer)
+        return len(state["plan"])
+
+    def move():
+        counts = sort_files(state["plan"], dst, args.mode, state["registry"], folder_lists, log,
+                            args.copy_workers, args.verify)
+        return counts["moved"]
+
+    def undo():
+        journal = read_journal()
+        pairs = journal_undo_pairs(journal) if journal else []
+        return undo_moves(pairs, log, args.copy_workers, args.verify)["restored"]
+
+    results = {"tree": tree, "phases": {}}
+    cwd = os.getcwd()
+    # the move journal and log are written to the working directory
+    os.chdir(workdir)
+    try:
+        results["phases"]["scan"] = measure(scan)
+        results["phases"]["plan"] = measure(lambda: plan(cache))
+        if cache is not None:
+            results["phases"]["plan_warm"] = measure(lambda: plan(cache))
+        results["phases"]["move"] = measure(move)
+        results["phases"]["undo"] = measure(undo)
+    finally:
+        os.chdir(cwd)
+        if args.dest_dir:
+            shutil.rmtree(dst, ignore_errors=True)
+    errors = [line for line in log_lines if line.startswith("Error")]
+    results["errors"] = len(errors)
+    for line in errors[:5]:
+        print(line, file=sys.stderr)
+    return results
+
+def summarize(runs):
+    # median of every numeric metric over the repeats
+    phases = {}
+    for name in PHASES:
+        samples = [r["phases"][name] for r in runs if name in r["phases"]]
+        if not samples:
+            continue
+        phases[name] = {}
+        for key in samples[0]:
+            values = [s[key] for s in samples if s.get(key) is not None]
+            phases[name][key] = statistics.median(values) if values else None
+    return phases
+
+def compare(phases, baseline, tolerance):
+    # (phase, baseline rate, current rate, change) for every phase slower
+    # than the baseline by more than tolerance
+    regressions = []
+    for name, current in phases.items():
+        base = baseline.get("phases", {}).get(name)
+        if not base or not base.get("items_per_sec") or not current.get("items_per_sec"):
+            continue
+        change = current["items_per_sec"] / base["items_per_sec"] - 1
+        if change < -tolerance:
+            regressions.append((name, base["items_per_sec"], current["items_per_sec"], change))
+    return regressions
+
+def print_report(report, baseline, stream):
+    cfg = report["config"]
+    print(f"{cfg['files']} files, depth {cfg['depth']}, fanout {cfg['fanout']}, sizes {cfg['sizes']}, "
+          f"mode {cfg['mode']}, {cfg['repeat']} run(s) on {report['workdir_fs']}", file=stream)
+    print(f"{'phase':<10} {'seconds':>9} {'files/s':>10} {'reads':>9} {'writes':>9} {'peak MB':>8} {'vs base':>8}",
+          file=stream)
+    for name, m in report["phases"].items():
+        base = (baseline or {}).get("phases", {}).get(name, {})
+        vs = ""
+        if base.get("items_per_sec") and m.get("items_per_sec"):
+            vs = f"{(m['items_per_sec'] / base['items_per_sec'] - 1) * 100:+.1f}%"
+        peak = f"{m['peak_rss_kb'] / 1024:.1f}" if m.get("peak_rss_kb") is not None else "-"
+        reads, writes = (f"{m[k]:.0f}" if m.get(k) is not None else "-" for k in ("read_syscalls", "write_syscalls"))
+        print(f"{name:<10} {m['seconds']:>9.3f} {m['items_per_sec'] or 0:>10.0f} "
+              f"{reads:>9} {writes:>9} {peak:>8} {vs:>8}", file=stream)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmark.py",
+                                     description="Time scan, plan, move and undo on a generated file tree.")
+    parser.add_argument("--files", type=int, default=10000, help="files to generate (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=3, help="folder levels below the source (default: %(default)s)")
+    parser.add_argument("--fanout", type=int, default=4, help="subfolders per folder (default: %(default)s)")
+    parser.add_argument("--mix", default="", help="category weights, e.g. Images=3,Documents=1 (default: equal)")
+    parser.add_argument("--unknown-ratio", type=float, default=0.1,
+                        help="share of files with no known extension (default: %(default)s)")
+    parser.add_argument("--dup-ratio", type=float, default=0.05,
+                        help="share of files reusing an earlier name (default: %(default)s)")
+    parser.add_argument("--sizes", default="lognormal:8:2",
+                        help="fixed:N, uniform:MIN:MAX or lognormal:MU:SIGMA (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="tree seed; repeats use seed, seed+1, ...")
+    parser.add_argument("--repeat", type=int, default=1, help="runs to take the median of (default: %(default)s)")
+    parser.add_argument("--mode", choices=DUPLICATE_MODES, default="Rename")
+    parser.add_argument("--workers", type=int, default=1, help="scan threads (default: %(default)s)")
+    parser.add_argument("--copy-workers", type=int, default=4, help="cross-device copy threads (default: %(default)s)")
+    parser.add_argument("--verify", choices=["size", "checksum", "none"], default="size")
+    parser.add_argument("--scan-cache", action="store_true", help="plan through the scan cache, cold then warm")
+    parser.add_argument("--sniff", choices=SNIFF_MODES, default="off")
+    parser.add_argument("--tmpfs", action="store_true", help="build the tree in /dev/shm")
+    parser.add_argument("--dir", help="parent folder for the tree (default: the system temp folder)")
+    parser.add_argument("--dest-dir", help="put the destination here instead, e.g. on another filesystem")
+    parser.add_argument("--keep", action="store_true", help="keep the generated tree")
+    parser.add_argument("--json", help="write the report as JSON to this file ('-' for stdout)")
+    parser.add_argument("--baseline", help="compare against a report saved with --json")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed files/sec drop against the baseline (default: %(default)s)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    parent = "/dev/shm" if args.tmpfs else args.dir
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    runs = []
+    for n in range(args.repeat):
+        workdir = Path(tempfile.mkdtemp(prefix="filesorter-bench-", dir=parent))
+        try:
+            runs.append(run_once(args, workdir, args.seed + n))
+        finally:
+            if args.keep:
+                print(f"Kept {workdir}", file=sys.stderr)
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+    config = {k: v for k, v in vars(args).items() if k not in ("json", "baseline", "keep")}
+    report = {
+        "config": config,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "workdir_fs": parent or tempfile.gettempdir(),
+        "tree": runs[0]["tree"],
+        "errors": sum(r["errors"] for r in runs),
+        "phases": summarize(runs),
+    }
+    out = sys.stderr if args.json == "-" else sys.stdout
+    print_report(report, baseline, out)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if baseline is not None:
+        changed = sorted(k for k, v in config.items() if k not in ("repeat", "tolerance", "dir", "tmpfs")
+                         and baseline.get("config", {}).get(k, v) != v)
+        if changed:
+            print(f"Warning: the baseline was run with different {', '.join(changed)}", file=out)
+        regressions = compare(report["phases"], baseline, args.tolerance)
+        for name, before, after, change in regressions:
+            print(f"Regression in {name}: {before:.0f} -> {after:.0f} files/s ({change * 100:+.1f}%)", file=out)
+        if regressions:
+            return 1
+    return 1 if report["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2063 @@
+from pathlib import Path
+import shutil
+import errno
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import select
+import stat
+import struct
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+SETTINGS_FILE = "settings.json"
+SCAN_CACHE_FILE = "scan_cache.json"
+HASH_CACHE_FILE = "hash_cache.json"
+SNIFF_CACHE_FILE = "sniff_cache.json"
+LOG_FILE = "file_sorter.log"
+JOURNAL_FILE = "move_journal.jsonl"
+RUN_STATS_FILE = "run_stats.jsonl"
+DEDUPE_MODE = "Dedupe by content"
+DUPLICATE_MODES = ["Skip", "Overwrite", "Rename", DEDUPE_MODE]
+DEFAULT_IGNORE = [".git", ".svn", ".hg", "node_modules", "__pycache__"]
+SNIFF_MODES = ["off", "unknown", "all"]
+# browsers write a download to name.part / name.crdownload (often next to an
+# empty placeholder at name) and rename it when it is complete
+DOWNLOAD_SUFFIXES = (".part", ".crdownload")
+
+class LogFile:
+    # size-rotated log sink: file_sorter.log, file_sorter.log.1 ... .N
+    def __init__(self, path=LOG_FILE, max_bytes=5 * 1024 * 1024, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def files(self):
+        paths = [f"{self.path}.{i}" for i in range(self.backups, 0, -1)] + [self.path]
+        return [p for p in paths if os.path.exists(p)]
+
+    def write_lines(self, lines):
+        if not lines:
+            return
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(f"{stamp} {line}\n" for line in lines))
+                size = f.tell()
+            if size > self.max_bytes:
+                self.rotate()
+        except OSError:
+            pass
+
+    def rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def iter_lines(self):
+        for path in self.files():
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    for line in f:
+                        yield line.rstrip("\n")
+            except OSError:
+                continue
+
+def load_settings(path=SETTINGS_FILE):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return {}
+    return {}
+
+def save_settings(source_paths, destination_path, selected_categories, folder_lists, duplicate_mode,
+                  path=SETTINGS_FILE, **options):
+    # keys the caller does not pass (e.g. ones only edited by hand) are kept
+    data = load_settings(path)
+    data.update({
+        "source_paths": [str(p) for p in source_paths],
+        "destination_path": str(destination_path),
+        "selected_categories": list(selected_categories),
+        "folder_lists": folder_lists,
+        "duplicate_mode": duplicate_mode
+    })
+    data.update(options)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+
+def default_folder_lists():
+    return {
+        "Installation Files": ["exe", "msi", "apk", "dmg", "pkg", "deb", "rpm", "bat", "sh", "appimage"],
+        "Documents": ["doc", "docx", "pdf", "txt", "rtf", "odt", "xls", "xlsx", "csv",
+                      "ppt", "pptx", "html", "htm", "md", "log", "json", "xml", "yml", "yaml"],
+        "Images": ["jpg", "jpeg", "png", "gif", "bmp", "tiff", "svg", "webp", "heic",
+                   "ico", "jfif", "psd", "ai", "eps"],
+        "Videos": ["mp4", "avi", "mov", "wmv", "flv", "mkv", "webm", "mpeg", "3gp",
+                   "mts", "m2ts", "ts"],
+        "Audio": ["mp3", "wav", "aac", "flac", "ogg", "m4a", "wma", "aiff", "opus"],
+        "Compressed Files": ["zip", "rar", "7z", "tar", "gz", "bz2", "xz", "iso", "cab", "zst"],
+        "Programming": ["py", "java", "c", "cpp", "cs", "js", "ts", "html", "css", "php",
+                        "swift", "kt", "go", "rs", "rb"],
+        "Design": ["fig", "sketch", "xd", "indd", "idml"]
+    }
+
+def settings_values(s: dict):
+    folder_lists = s.get("folder_lists", default_folder_lists())
+    return {
+        "folder_lists": folder_lists,
+        "source_paths": [Path(p) for p in s.get("source_paths", [])],
+        "destination_path": Path(s.get("destination_path", "D:/Downloads")),
+        "selected_categories": set(s.get("selected_categories", list(folder_lists.keys()))),
+        "duplicate_mode": s.get("duplicate_mode", "Rename"),
+        "scan_workers": int(s.get("scan_workers", 1)),
+        "copy_workers": int(s.get("copy_workers", 4)),
+        "verify_transfers": s.get("verify_transfers", "size"),
+        "scan_cache": bool(s.get("scan_cache", True)),
+        "ignore_patterns": list(s.get("ignore_patterns", DEFAULT_IGNORE)),
+        "max_depth": None if s.get("max_depth") is None else int(s["max_depth"]),
+        "follow_symlinks": bool(s.get("follow_symlinks", False)),
+        "sniff_content": s.get("sniff_content", "off") if s.get("sniff_content") in SNIFF_MODES else "off",
+        "max_files_per_sec": float(s.get("max_files_per_sec") or 0),
+        "max_mb_per_sec": float(s.get("max_mb_per_sec") or 0),
+    }
+
+def create_folders(target_path: Path, folder_list: dict):
+    for folder_name in folder_list:
+        (target_path / folder_name).mkdir(parents=True, exist_ok=True)
+
+class NameRegistry:
+    # per-destination-folder view of taken names: one listing per folder, then
+    # planned names are added as they are handed out, and "Rename" suffixes
+    # continue from the last counter used for that stem
+    def __init__(self):
+        self.folders = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def _names(self, folder: Path):
+        names = self.folders.get(folder)
+        if names is None:
+            try:
+                names = {os.path.normcase(n) for n in os.listdir(folder)}
+            except OSError:
+                names = set()
+            self.folders[folder] = names
+        return names
+
+    def mark_taken(self, path: Path):
+        with self.lock:
+            self._names(path.parent).add(os.path.normcase(path.name))
+
+    def claim(self, folder: Path, name: str, mode: str):
+        with self.lock:
+            names = self._names(folder)
+            key = os.path.normcase(name)
+            if key in names:
+                if mode == "Skip":
+                    return None
+                elif mode in ("Rename", DEDUPE_MODE):
+                    # content duplicates are already dropped when planning, so a
+                    # name clash here is a different file and gets renamed
+                    p = Path(name)
+                    counter_key = (folder, os.path.normcase(p.stem), os.path.normcase(p.suffix))
+                    counter = self.counters.get(counter_key, 1)
+                    while True:
+                        name = f"{p.stem}_{counter}{p.suffix}"
+                        key = os.path.normcase(name)
+                        counter += 1
+                        if key not in names:
+                            break
+                    self.counters[counter_key] = counter
+            names.add(key)
+            return folder / name
+
+def clear_destination(dst: Path):
+    try:
+        if dst.is_dir() and not dst.is_symlink():
+            shutil.rmtree(dst)
+    except Exception:
+        pass
+
+def resolve_destination(src: Path, dst_folder: Path, mode: str, registry=None):
+    if registry is not None:
+        dst = registry.claim(dst_folder, src.name, mode)
+        if dst is not None and mode == "Overwrite":
+            clear_destination(dst)
+        return dst
+    dst = dst_folder / src.name
+    if dst.exists():
+        if mode == "Skip":
+            return None
+        elif mode == "Overwrite":
+            try:
+                if dst.is_file():
+                    os.remove(dst)
+                else:
+                    shutil.rmtree(dst)
+            except Exception:
+                pass
+        elif mode in ("Rename", DEDUPE_MODE):
+            counter = 1
+            while dst.exists():
+                dst = dst_folder / f"{src.stem}_{counter}{src.suffix}"
+                counter += 1
+    return dst
+
+TRANSFER_CHUNK = 64 * 1024 * 1024
+
+def copy_file_data(fsrc, fdst, size):
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    offset = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while offset < size:
+                n = os.copy_file_range(infd, outfd, min(TRANSFER_CHUNK, size - offset), offset, offset)
+                if n == 0:
+                    break
+                offset += n
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM):
+                raise
+    if offset < size and hasattr(os, "sendfile"):
+        try:
+            os.lseek(outfd, offset, os.SEEK_SET)
+            while offset < size:
+                n = os.sendfile(outfd, infd, offset, min(TRANSFER_CHUNK, size - offset))
+                if n == 0:
+                    break
+                offset += n
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSOCK):
+                raise
+    fsrc.seek(offset)
+    fdst.seek(offset)
+    shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+
+def file_checksum(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def partial_path(dst: Path):
+    return dst.with_name(f".{dst.name}.part-{os.getpid()}")
+
+def rename_no_replace(src: Path, dst: Path):
+    # os.rename silently replaces an existing dst on POSIX; a hard link refuses
+    # to, so regular files are linked into place and the old name unlinked
+    try:
+        if not stat.S_ISREG(os.lstat(src).st_mode):
+            raise NotImplementedError
+        os.link(src, dst)
+    except (AttributeError, NotImplementedError):
+        pass
+    except OSError as e:
+        if e.errno not in (errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS, errno.EMLINK):
+            raise
+    else:
+        os.remove(src)
+        return
+    # no hard links here (or not a regular file)
+    if os.path.lexists(dst):
+        raise FileExistsError(errno.EEXIST, "Destination already exists", str(dst))
+    os.rename(src, dst)
+
+def install_file(part: Path, dst: Path, overwrite=False):
+    # puts a finished copy in place; without overwrite an existing dst is never replaced
+    if overwrite:
+        os.replace(part, dst)
+    else:
+        rename_no_replace(part, dst)
+
+def fsync_dir(path: Path):
+    # makes a new name in this folder durable; folders cannot be opened on Windows
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def transfer_file(src: Path, dst: Path, verify="size", overwrite=False):
+    # cross-filesystem move: kernel-side copy to a temporary name next to dst,
+    # metadata, fsync, optional verification, then the copy is put in place and
+    # only then is the source unlinked. A crash mid-copy leaves a .part file,
+    # never a truncated dst.
+    if os.path.islink(src):
+        return Path(shutil.move(str(src), str(dst)))
+    size = os.stat(src).st_size
+    part = partial_path(dst)
+    try:
+        with open(src, "rb") as fsrc, open(part, "wb") as fdst:
+            copy_file_data(fsrc, fdst, size)
+            fdst.flush()
+            shutil.copystat(src, part)
+            os.fsync(fdst.fileno())
+        if verify == "size" and os.stat(part).st_size != size:
+            raise OSError(f"Size mismatch after copying {src}")
+        if verify == "checksum" and file_checksum(src) != file_checksum(part):
+            raise OSError(f"Checksum mismatch after copying {src}")
+        install_file(part, dst, overwrite)
+    except BaseException:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+    # the source goes only once the new name has reached the disk
+    fsync_dir(dst.parent)
+    os.remove(src)
+    return dst
+
+def remove_partial_copies(paths):
+    # .part files left next to these destinations by a run that crashed mid-copy
+    folders = {}
+    for path in paths:
+        folders.setdefault(Path(path).parent, set()).add(Path(path).name)
+    for folder, names in folders.items():
+        try:
+            entries = os.listdir(folder)
+        except OSError:
+            continue
+        for entry in entries:
+            name, sep, pid = entry[1:].rpartition(".part-")
+            if entry.startswith(".") and sep and pid.isdigit() and name in names:
+                try:
+                    os.remove(folder / entry)
+                except OSError:
+                    pass
+
+def relocate(src: Path, dst: Path, overwrite=False, verify="size", stats=None):
+    try:
+        (os.replace if overwrite else rename_no_replace)(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        transfer_file(src, dst, verify, overwrite)
+        if stats is not None:
+            stats.add(copies=1)
+        return dst
+    if stats is not None:
+        stats.add(renames=1)
+    return dst
+
+def move_file_one(src: Path, dst_folder: Path, mode: str, verify="size", registry=None):
+    dst = resolve_destination(src, dst_folder, mode, registry)
+    if dst is None:
+        return None
+    return relocate(src, dst, mode == "Overwrite", verify)
+
+class RunControl:
+    # pause, resume and cancel for a running sort or undo. The move loops call
+    # checkpoint() before each file, so a file is never left half-moved, and a
+    # cancelled run stops with its journal unfinished: resume continues from
+    # the last file done without rescanning. A rate limit (files/sec, MB/sec;
+    # 0 is unlimited) spaces the files out; paused time does not count.
+    def __init__(self, max_files_per_sec=0, max_mb_per_sec=0):
+        self.max_files_per_sec = max_files_per_sec
+        self.max_mb_per_sec = max_mb_per_sec
+        self.running = threading.Event()
+        self.running.set()
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.window = None
+        self.files = 0
+        self.bytes = 0
+
+    @property
+    def paused(self):
+        return not self.running.is_set()
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        with self.lock:
+            self.window = None
+        self.running.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.running.set()
+
+    def checkpoint(self, size=0):
+        # blocks while paused; False once the run is cancelled
+        self.running.wait()
+        if self.cancelled.is_set():
+            return False
+        if self.max_files_per_sec or self.max_mb_per_sec:
+            with self.lock:
+                now = time.monotonic()
+                if self.window is None:
+                    self.window, self.files, self.bytes = now, 0, 0
+                due = self.window + max(self.files / self.max_files_per_sec if self.max_files_per_sec else 0,
+                                        self.bytes / (self.max_mb_per_sec * 1e6) if self.max_mb_per_sec else 0)
+                self.files += 1
+                self.bytes += size or 0
+            if due > now:
+                self.cancelled.wait(due - now)
+                self.running.wait()
+        return not self.cancelled.is_set()
+
+def move_plan(plan, mode: str, on_result, copy_workers=4, verify="size", registry=None, stats=None, control=None):
+    # plan is a MovePlan (or an iterable of (src, dst, size, mtime_ns)) with dst
+    # already resolved through the registry; None means skipped as a duplicate.
+    # Same-device moves are plain renames on the calling thread; cross-device
+    # moves are copies and go to a separate bounded pool.
+    # on_result(status, src, dst, error) is called under a lock with status one
+    # of moved/skipped/stale/missing/error. stats gets the moved files and bytes,
+    # renames vs copies and late name collisions. Files not reached before
+    # control is cancelled get no on_result call.
+    if registry is None:
+        registry = NameRegistry()
+    lock = threading.Lock()
+    dst_devs = {}
+    items = []
+    moves = plan.moves() if isinstance(plan, MovePlan) else plan
+    for src, dst, size, mtime_ns in moves:
+        if control is not None and control.cancelled.is_set():
+            break
+        try:
+            st = os.stat(src)
+        except OSError:
+            with lock:
+                on_result("missing", src, None, None)
+            continue
+        if size is not None and (st.st_size != size or st.st_mtime_ns != mtime_ns):
+            with lock:
+                on_result("stale", src, None, None)
+            continue
+        src_dev = st.st_dev
+        if dst is None:
+            with lock:
+                on_result("skipped", src, None, None)
+            continue
+        dst_folder = dst.parent
+        if dst_folder not in dst_devs:
+            try:
+                dst_devs[dst_folder] = os.stat(dst_folder).st_dev
+            except OSError:
+                dst_devs[dst_folder] = None
+        items.append((src, dst, st.st_size, src_dev == dst_devs[dst_folder]))
+
+    def move_one(src, dst, size, same_device):
+        if control is not None and not control.checkpoint(size):
+            return
+        try:
+            if mode == "Overwrite":
+                clear_destination(dst)
+            elif os.path.lexists(dst):
+                # something appeared at the planned name since the plan was made
+                registry.mark_taken(dst)
+                dst = registry.claim(dst.parent, src.name, mode)
+                if stats is not None:
+                    stats.add(collisions=1)
+            if dst is None:
+                status = "skipped"
+            else:
+                if same_device:
+                    relocate(src, dst, mode == "Overwrite", verify, stats)
+                else:
+                    transfer_file(src, dst, verify, mode == "Overwrite")
+                    if stats is not None:
+                        stats.add(copies=1)
+                if stats is not None:
+                    stats.add(files=1, bytes=size)
+                status = "moved"
+            error = None
+        except Exception as e:
+            dst, status, error = None, "error", e
+        with lock:
+            on_result(status, src, dst, error)
+
+    def move_chain(chain):
+        for item in chain:
+            move_one(*item)
+
+    chains = []
+    if mode == "Overwrite":
+        # several sources can be planned onto one name. Those moves run in plan
+        # order on one thread, so two of them never write the same file at once
+        # and the last one wins, as it would in a sequential loop.
+        by_dst = {}
+        for item in items:
+            by_dst.setdefault(os.path.normcase(str(item[1])), []).append(item)
+        items = [chain[0] for chain in by_dst.values() if len(chain) == 1]
+        chains = [chain for chain in by_dst.values() if len(chain) > 1]
+    with ThreadPoolExecutor(max_workers=max(1, copy_workers)) as pool:
+        for chain in chains:
+            pool.submit(move_chain, chain)
+        for item in items:
+            if not item[3]:
+                pool.submit(move_one, *item)
+        for item in items:
+            if item[3]:
+                move_one(*item)
+
+class MoveJournal:
+    # append-only record of the last sort run (begin, plan, done, end, then
+    # undo, undone, undo_end). Lines are fsynced in batches, so a crash loses
+    # at most the last unsynced batch, which resume reconciles from disk.
+    def __init__(self, path=JOURNAL_FILE, sync_every=500, sync_interval=1.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.f = None
+        self.pending = 0
+        self.last_sync = 0.0
+
+    def open(self, fresh=False):
+        try:
+            self.f = open(self.path, "w" if fresh else "a", encoding="utf-8")
+        except OSError:
+            self.f = None
+        self.last_sync = time.monotonic()
+        return self.f is not None
+
+    def begin(self, target: Path, mode: str):
+        if self.open(fresh=True):
+            self.write({"op": "begin", "target": str(target), "mode": mode, "time": time.time()}, sync=True)
+        return self.f is not None
+
+    def write(self, record, sync=False):
+        with self.lock:
+            if self.f is None:
+                return
+            self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.pending += 1
+            if sync or self.pending >= self.sync_every or time.monotonic() - self.last_sync >= self.sync_interval:
+                self._sync()
+
+    def record(self, op: str, src, dst):
+        self.write({"op": op, "src": str(src), "dst": str(dst)})
+
+    def sync(self):
+        with self.lock:
+            if self.f is not None and self.pending:
+                self._sync()
+
+    def _sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.f is not None:
+                self._sync()
+                self.f.close()
+                self.f = None
+
+def read_journal(path=JOURNAL_FILE):
+    if not os.path.exists(path):
+        return None
+    state = {"target": None, "mode": "Rename", "planned": [], "done": [], "undone": set(),
+             "finished": False, "undoing": False, "undo_finished": False}
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                # a torn last line from a crash
+                continue
+            op = rec.get("op")
+            if op == "begin":
+                state["target"] = rec.get("target")
+                state["mode"] = rec.get("mode", "Rename")
+            elif op == "plan":
+                state["planned"].append((rec["src"], rec["dst"]))
+            elif op == "done":
+                state["done"].append((rec["src"], rec["dst"]))
+            elif op == "end":
+                state["finished"] = True
+            elif op == "undo":
+                state["undoing"] = True
+            elif op == "undone":
+                state["undone"].add(rec["dst"])
+            elif op == "undo_end":
+                state["undo_finished"] = True
+    if state["target"] is None:
+        return None
+    return state
+
+def journal_pending(state):
+    # "sort" or "undo" when the journal ends in the middle of one, else None
+    if state is None or state["undo_finished"]:
+        return None
+    if state["undoing"]:
+        # a crash after the last file was restored but before "undo_end" was
+        # written leaves nothing to do; that undo counts as finished
+        return "undo" if any(dst not in state["undone"] for _, dst in state["done"]) else None
+    if not state["finished"]:
+        return "sort"
+    return None
+
+def journal_remaining(state):
+    done = {src for src, _ in state["done"]}
+    return [(Path(src), Path(dst)) for src, dst in state["planned"] if src not in done]
+
+def journal_leftovers(state):
+    # planned destinations the sort never reached
+    return [dst for _, dst in journal_remaining(state)] if state else []
+
+def journal_undo_pairs(state):
+    if state["undo_finished"]:
+        return []
+    return [(Path(dst), Path(src)) for src, dst in state["done"] if dst not in state["undone"]]
+
+def restore_moves(pairs, on_result, workers=4, verify="size", stats=None, control=None):
+    # pairs of (new_path, old_path). When several moves ended at the same path
+    # (Overwrite mode) only the last one is restored, as a reversed replay would.
+    # A file is never replaced: if its original path is taken it is restored
+    # under a "Rename" name next to it, and pairs with the same original path
+    # run in order on one thread. on_result(status, new_path, old_path, error)
+    # runs under a lock with status one of restored/missing/error and old_path
+    # where the file actually went.
+    latest = {}
+    for new_path, old_path in pairs:
+        latest.pop(new_path, None)
+        latest[new_path] = old_path
+    by_old = {}
+    for new_path, old_path in reversed(list(latest.items())):
+        by_old.setdefault(os.path.normcase(str(old_path)), []).append((new_path, old_path))
+    registry = NameRegistry()
+    lock = threading.Lock()
+
+    def restore_one(new_path, old_path):
+        try:
+            size = os.lstat(new_path).st_size
+        except OSError:
+            size = None
+        if control is not None and not control.checkpoint(size):
+            return
+        try:
+            if size is not None:
+                old_path.parent.mkdir(parents=True, exist_ok=True)
+                target = old_path
+                while True:
+                    try:
+                        relocate(new_path, target, verify=verify, stats=stats)
+                        break
+                    except FileExistsError:
+                        registry.mark_taken(target)
+                        target = registry.claim(old_path.parent, old_path.name, "Rename")
+                old_path = target
+                if stats is not None:
+                    stats.add(files=1, bytes=size)
+                status = "restored"
+            else:
+                status = "missing"
+            error = None
+        except Exception as e:
+            status, error = "error", e
+        with lock:
+            on_result(status, new_path, old_path, error)
+
+    def restore_chain(chain):
+        for pair in chain:
+            restore_one(*pair)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for chain in by_old.values():
+            pool.submit(restore_chain, chain)
+
+class ExtensionClassifier:
+    def __init__(self, folder_lists: dict, selected_categories):
+        self.categories = frozenset(selected_categories)
+        self.index = {}
+        self.max_parts = 1
+        # categories are registered in folder_lists order, so an extension listed
+        # in several categories (html, ts) always resolves to the first one
+        for cat, exts in folder_lists.items():
+            if cat not in self.categories:
+                continue
+            for ext in exts:
+                key = ext.strip().lstrip(".").lower()
+                if not key or key in self.index:
+                    continue
+                self.index[key] = cat
+                self.max_parts = max(self.max_parts, key.count(".") + 1)
+
+    def classify(self, name: str):
+        name = name.lower()
+        if name.startswith("."):
+            name = name[1:]
+        parts = name.split(".")
+        for n in range(min(self.max_parts, len(parts) - 1), 0, -1):
+            cat = self.index.get(".".join(parts[-n:]))
+            if cat is not None:
+                return cat
+        return None
+
+def list_dir(path, follow_symlinks=False):
+    files, subdirs = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_file():
+                        files.append(entry)
+                    elif entry.is_dir(follow_symlinks=follow_symlinks):
+                        subdirs.append(entry.path)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, subdirs
+
+def destination_excludes(sources, target: Path, categories):
+    # the destination's category folders are never scanned. The destination
+    # itself is skipped only where it lies below a source root (Downloads ->
+    # Downloads/Sorted); a source inside the destination is still scanned.
+    dirs = [target / cat for cat in categories]
+    target_key = os.path.normcase(os.path.abspath(target))
+    for src in sources:
+        src_key = os.path.normcase(os.path.abspath(src))
+        if src_key != target_key and is_within(target_key, src_key):
+            dirs.append(target)
+            break
+    return dirs
+
+class ScanRules:
+    # subtrees the walker does not descend into: excluded directories (the
+    # destination), names or root-relative paths matching an ignore pattern,
+    # anything deeper than max_depth folders below a source root, and, when
+    # directory symlinks are followed, directories already reached by another path
+    def __init__(self, roots, exclude=(), ignore=DEFAULT_IGNORE, max_depth=None, follow_symlinks=False):
+        self.roots = sorted({os.path.normcase(os.path.abspath(r)) for r in roots}, key=len, reverse=True)
+        self.exclude = {os.path.normcase(os.path.abspath(d)) for d in exclude}
+        flags = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+        names = [fnmatch.translate(p) for p in ignore if p and "/" not in p]
+        paths = [fnmatch.translate(p.strip("/")) for p in ignore if p and "/" in p]
+        self.name_re = re.compile("|".join(names), flags) if names else None
+        self.path_re = re.compile("|".join(paths), flags) if paths else None
+        self.max_depth = max_depth
+        self.follow_symlinks = follow_symlinks
+        self.visited = {}
+        self.lock = threading.Lock()
+        if follow_symlinks:
+            for root in self.roots:
+                try:
+                    st = os.stat(root)
+                except OSError:
+                    continue
+                self.visited.setdefault((st.st_dev, st.st_ino), root)
+
+    def _relative(self, norm: str):
+        # normcased absolute path below its source root, "/"-separated ("" for
+        # the root itself), or None outside every root
+        for root in self.roots:
+            if is_within(norm, root):
+                return norm[len(root):].strip(os.sep).replace(os.sep, "/")
+        return None
+
+    def _ignored(self, name: str, rel):
+        if self.name_re is not None and self.name_re.match(name):
+            return True
+        return self.path_re is not None and rel is not None and self.path_re.match(rel) is not None
+
+    def excludes_root(self, root):
+        norm = os.path.normcase(os.path.abspath(root))
+        return any(is_within(norm, d) for d in self.exclude)
+
+    def skip_dir(self, path: str):
+        norm = os.path.normcase(os.path.abspath(path))
+        if norm in self.exclude:
+            return True
+        rel = self._relative(norm)
+        if rel:
+            if self._ignored(os.path.basename(path), rel):
+                return True
+            if self.max_depth is not None and rel.count("/") + 1 > self.max_depth:
+                return True
+        if self.follow_symlinks:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return True
+            with self.lock:
+                first = self.visited.setdefault((st.st_dev, st.st_ino), norm)
+            if first != norm:
+                # a symlink back into (or across) the tree
+                return True
+        return False
+
+    def skip_file(self, path: str):
+        return self._ignored(os.path.basename(path), self._relative(os.path.normcase(os.path.abspath(path))))
+
+    def lister(self, inner=None):
+        if inner is None:
+            follow = self.follow_symlinks
+
+            def inner(path):
+                return list_dir(path, follow)
+
+        def list_pruned(path):
+            files, subdirs = inner(path)
+            if self.name_re is not None or self.path_re is not None:
+                rel = self._relative(os.path.normcase(os.path.abspath(path)))
+                prefix = rel + "/" if rel else ""
+                files = [e for e in files if not self._ignored(e.name, None if rel is None else prefix + e.name)]
+            return files, [d for d in subdirs if not self.skip_dir(d)]
+
+        return list_pruned
+
+def iter_files(root, cancel=None, lister=list_dir):
+    # same pre-order walk as Path.rglob("*"), but file/dir checks come from the
+    # DirEntry cache instead of an extra stat per path
+    stack = [os.fspath(root)]
+    while stack:
+        if cancel is not None and cancel.is_set():
+            return
+        files, subdirs = lister(stack.pop())
+        yield from files
+        stack.extend(reversed(subdirs))
+
+def iter_files_parallel(roots, workers, cancel=None, prefetch=None, lister=list_dir):
+    # directories are listed ahead of time on the pool, each listing scheduling
+    # its own subdirectories; results are consumed in the sequential walk order.
+    # Files accepted by prefetch(name) get their stat cached on the pool too.
+    # set when the walk ends early, so queued listings return at once instead
+    # of scheduling more (cancel_futures needs Python 3.9)
+    stopped = threading.Event()
+
+    def list_node(path):
+        if stopped.is_set() or (cancel is not None and cancel.is_set()):
+            return [], []
+        files, subdirs = lister(path)
+        if prefetch is not None:
+            for entry in files:
+                if prefetch(entry.name):
+                    try:
+                        entry.stat()
+                    except OSError:
+                        pass
+        children = []
+        for d in subdirs:
+            try:
+                children.append(pool.submit(list_node, d))
+            except RuntimeError:
+                break
+        return files, children
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        stack = [pool.submit(list_node, os.fspath(r)) for r in reversed(roots)]
+        while stack:
+            if cancel is not None and cancel.is_set():
+                return
+            files, children = stack.pop().result()
+            yield from files
+            stack.extend(reversed(children))
+    finally:
+        stopped.set()
+        for future in stack:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+class CachedEntry:
+    # stands in for os.DirEntry when a directory listing comes from the scan
+    # cache; no stat is known, so the sort only checks that the file exists
+    __slots__ = ("name", "path")
+
+    def __init__(self, dirpath: str, name: str):
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+
+    def stat(self):
+        return None
+
+class ScanCache:
+    # per-directory listings keyed on the directory's mtime and inode. Only
+    # names that match some category in folder_lists are kept, and the whole
+    # cache is dropped when folder_lists changes.
+    def __init__(self, folder_lists: dict, path=SCAN_CACHE_FILE, follow_symlinks=False, keep_all=False):
+        # keep_all also keeps names no category matches, for content sniffing
+        self.path = path
+        self.follow_symlinks = follow_symlinks
+        self.keep_all = keep_all
+        key = json.dumps([folder_lists, follow_symlinks, keep_all], sort_keys=True)
+        self.signature = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        self.matcher = ExtensionClassifier(folder_lists, folder_lists.keys())
+        self.dirs = {}
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        self.loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self
+        if data.get("signature") == self.signature:
+            self.dirs = data.get("dirs", {})
+        return self
+
+    def save(self, roots=()):
+        # after a complete scan of roots, directories under them that were not
+        # visited any more are dropped
+        roots = [os.fspath(r) for r in roots]
+        with self.lock:
+            dirs = {d: v for d, v in self.dirs.items()
+                    if d in self.seen or not any(is_within(d, r) for r in roots)}
+            self.seen = set()
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"signature": self.signature, "dirs": dirs}, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def list_dir(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return [], []
+        with self.lock:
+            self.seen.add(path)
+            cached = self.dirs.get(path)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_ino:
+            return [CachedEntry(path, n) for n in cached[3]], [os.path.join(path, d) for d in cached[2]]
+        files, subdirs = list_dir(path, self.follow_symlinks)
+        if time.time_ns() - st.st_mtime_ns > 2_000_000_000:
+            # a directory changed in the last couple of seconds may change again
+            # within the same mtime tick, so it is only cached once it settles
+            names = [e.name for e in files if self.keep_all or self.matcher.classify(e.name) is not None]
+            with self.lock:
+                self.dirs[path] = [st.st_mtime_ns, st.st_ino, [os.path.basename(d) for d in subdirs], names]
+        else:
+            with self.lock:
+                self.dirs.pop(path, None)
+        return files, subdirs
+
+SNIFF_BYTES = 512
+# bumped when the signatures change, so cached results from older rules are dropped
+SNIFF_RULES = 2
+
+# (offset, signature, extension), first match wins; formats that need more
+# than a prefix test are handled in sniff_extension
+MAGIC_SIGNATURES = [
+    (0, b"%PDF-", "pdf"),
+    (0, b"\x89PNG\r\n\x1a\n", "png"),
+    (0, b"\xff\xd8\xff", "jpg"),
+    (0, b"GIF87a", "gif"),
+    (0, b"GIF89a", "gif"),
+    (0, b"II*\x00", "tiff"),
+    (0, b"MM\x00*", "tiff"),
+    (0, b"8BPS", "psd"),
+    (0, b"FLV\x01", "flv"),
+    (0, b"0&\xb2u\x8ef\xcf\x11\xa6\xd9\x00\xaa\x00b\xce\x6c", "wmv"),
+    (0, b"\x00\x00\x01\xba", "mpeg"),
+    (0, b"ID3", "mp3"),
+    (0, b"fLaC", "flac"),
+    (0, b"OggS", "ogg"),
+    (0, b"Rar!\x1a\x07", "rar"),
+    (0, b"7z\xbc\xaf\x27\x1c", "7z"),
+    (0, b"\x1f\x8b\x08", "gz"),
+    (0, b"BZh", "bz2"),
+    (0, b"\xfd7zXZ\x00", "xz"),
+    (0, b"\x28\xb5\x2f\xfd", "zst"),
+    (0, b"MSCF\x00\x00\x00\x00", "cab"),
+    (0, b"!<arch>\ndebian", "deb"),
+    (0, b"\xed\xab\xee\xdb", "rpm"),
+    (0, b"xar!", "pkg"),
+    (0, b"{\\rtf", "rtf"),
+    (257, b"ustar", "tar"),
+]
+
+# containers shared by several formats, and matches too weak to trust over an
+# extension (a bare MPEG frame sync, a UTF-16 byte-order mark); with
+# sniff_content "all" these never override a category the extension already gave
+SNIFF_GENERIC = {"zip", "xml", "gz", "mp4", "ogg", "wmv", "mp3", "aac", "txt"}
+
+# kbit/s by bitrate index for (MPEG-1 or not, layer bits)
+MPEG_BITRATES = {
+    (True, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MPEG_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+def mpeg_audio_frame(head: bytes):
+    # (extension, frame length) for a valid MPEG audio or ADTS header, or None
+    if len(head) < 6 or head[0] != 0xFF or head[1] & 0xE0 != 0xE0:
+        return None
+    version, layer = head[1] >> 3 & 3, head[1] >> 1 & 3
+    if layer == 0:
+        # ADTS (AAC): 12-bit sync, sampling index 13-15 reserved
+        if head[1] & 0xF6 != 0xF0 or head[2] >> 2 & 0xF > 12:
+            return None
+        length = (head[3] & 3) << 11 | head[4] << 3 | head[5] >> 5
+        return ("aac", length) if length >= 7 else None
+    bitrate, rate, padding = head[2] >> 4, head[2] >> 2 & 3, head[2] >> 1 & 1
+    if version == 1 or bitrate in (0, 15) or rate == 3:
+        return None
+    kbps, hz = MPEG_BITRATES[(version == 3, layer)][bitrate], MPEG_SAMPLE_RATES[version][rate]
+    if layer == 3:
+        length = (12000 * kbps // hz + padding) * 4
+    else:
+        length = (144000 if version == 3 or layer == 2 else 72000) * kbps // hz + padding
+    return "mp3", length
+
+def sniff_extension(head: bytes):
+    # extension for the first bytes of a file, or None
+    if head[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        # UTF-16 text; FF FE would otherwise pass for an MPEG frame sync
+        return "txt"
+    for offset, signature, ext in MAGIC_SIGNATURES:
+        if head.startswith(signature, offset):
+            return ext
+    if head[:4] == b"RIFF":
+        return {b"WEBP": "webp", b"WAVE": "wav", b"AVI ": "avi"}.get(head[8:12])
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"heic", b"heix", b"hevc", b"mif1", b"msf1"):
+            return "heic"
+        if brand == b"qt  ":
+            return "mov"
+        if brand in (b"M4A ", b"M4B "):
+            return "m4a"
+        if brand[:3] in (b"3gp", b"3g2"):
+            return "3gp"
+        return "mp4"
+    if head[:4] == b"\x1aE\xdf\xa3":
+        return "webm" if b"webm" in head[:64] else "mkv"
+    if head[:4] == b"PK\x03\x04":
+        if b"mimetypeapplication/vnd.oasis.opendocument.text" in head:
+            return "odt"
+        for marker, ext in ((b"word/", "docx"), (b"xl/", "xlsx"), (b"ppt/", "pptx"), (b"AndroidManifest.xml", "apk")):
+            if marker in head:
+                return ext
+        return "zip"
+    frame = mpeg_audio_frame(head)
+    if frame is not None:
+        # a second frame must follow when it starts within the bytes read
+        ext, length = frame
+        if len(head) < length + 6:
+            return ext
+        following = mpeg_audio_frame(head[length:])
+        return ext if following is not None and following[0] == ext else None
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if text.startswith(b"#!"):
+        line = text.split(b"\n", 1)[0]
+        if b"python" in line:
+            return "py"
+        if line.endswith((b"sh", b"bash", b"zsh")):
+            return "sh"
+        return None
+    if text.startswith(b"<?xml"):
+        return "svg" if b"<svg" in text else "xml"
+    if text.startswith((b"<!doctype html", b"<html")):
+        return "html"
+    if text.startswith(b"<svg"):
+        return "svg"
+    return None
+
+class ContentSniffer:
+    # classifies files by their first SNIFF_BYTES bytes. In "unknown" mode only
+    # files the extension index does not place are read; in "all" mode every
+    # file is, and a specific signature overrides the extension. Results are
+    # cached per (device, inode) while size and mtime are unchanged.
+    def __init__(self, classifier, mode="unknown", workers=4, path=SNIFF_CACHE_FILE):
+        self.index = classifier.index
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.path = path
+        self.entries = {}
+        self.used = set()
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        self.loaded = True
+        if self.path is None:
+            return self
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.entries = data.get("files", {}) if data.get("rules") == SNIFF_RULES else {}
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+        return self
+
+    def save(self, complete=False):
+        # after a complete scan only the entries it looked up are kept
+        if self.path is None:
+            return
+        with self.lock:
+            entries = {k: e for k, e in self.entries.items() if k in self.used} if complete else dict(self.entries)
+            if complete:
+                self.used = set()
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"rules": SNIFF_RULES, "files": entries}, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def wants(self, cat):
+        return self.mode == "all" or cat is None
+
+    def sniff(self, path: str, st):
+        key = f"{st.st_dev}:{st.st_ino}" if st.st_ino else path
+        with self.lock:
+            self.used.add(key)
+            entry = self.entries.get(key)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2] or None
+        try:
+            with open(path, "rb") as f:
+                head = f.read(SNIFF_BYTES)
+        except OSError:
+            return None
+        ext = sniff_extension(head)
+        with self.lock:
+            self.entries[key] = [st.st_size, st.st_mtime_ns, ext or ""]
+        return ext
+
+    def categorize(self, items):
+        # items are (path, stat or None, category from the extension); returns
+        # the category for each, None when neither placed the file
+        def one(item):
+            path, st, cat = item
+            try:
+                if st is None:
+                    st = os.stat(path)
+                ext = self.sniff(path, st)
+            except OSError:
+                return cat
+            sniffed = self.index.get(ext) if ext else None
+            if sniffed is None or (cat is not None and ext in SNIFF_GENERIC):
+                return cat
+            return sniffed
+
+        if len(items) < 2:
+            return [one(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(one, items))
+
+HASH_BLOCK = 64 * 1024
+
+def partial_checksum(path, size):
+    # first and last block only; files up to two blocks are hashed whole
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        h.update(f.read(HASH_BLOCK))
+        if size > 2 * HASH_BLOCK:
+            f.seek(size - HASH_BLOCK)
+        h.update(f.read(HASH_BLOCK))
+    return h.hexdigest()
+
+class HashCache:
+    # partial and full content hashes per path, reused while the file's size
+    # and mtime are unchanged
+    def __init__(self, path=HASH_CACHE_FILE):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        self.loaded = True
+        if self.path is None:
+            return self
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("files", {})
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+        return self
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            entries = {p: e for p, e in self.entries.items() if os.path.lexists(p)}
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"files": entries}, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def get(self, path: str, size: int, mtime_ns: int, full=False):
+        slot = 3 if full else 2
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry is not None and entry[0] == size and entry[1] == mtime_ns and entry[slot] is not None:
+            return entry[slot]
+        digest = file_checksum(path) if full else partial_checksum(path, size)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry[0] != size or entry[1] != mtime_ns:
+                entry = self.entries[path] = [size, mtime_ns, None, None]
+            entry[slot] = digest
+        return digest
+
+    def rename(self, src, dst):
+        # a rename or verified copy keeps size and mtime, so the hashes still hold
+        src, dst = os.fspath(src), os.fspath(dst)
+        with self.lock:
+            entry = self.entries.pop(src, None)
+            if entry is not None:
+                self.entries[dst] = entry
+
+class ContentIndex:
+    # files already in the destination or kept earlier in the plan, grouped by
+    # size. Only files sharing a size are hashed: the partial hash first, and
+    # the full hash only for files whose partial hashes match too.
+    def __init__(self, hash_cache=None, workers=4):
+        self.hashes = hash_cache if hash_cache is not None else HashCache(None)
+        self.workers = max(1, workers)
+        self.by_size = {}
+
+    def add_tree(self, root):
+        for entry in iter_files(root):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            self.by_size.setdefault(st.st_size, []).append((entry.path, st.st_size, st.st_mtime_ns))
+
+    def _hash_all(self, pool, files, full):
+        def one(f):
+            try:
+                return self.hashes.get(*f, full=full)
+            except OSError:
+                return None
+        return dict(zip((f[0] for f in files), pool.map(one, files)))
+
+    def duplicates(self, files):
+        # files are (path, size, mtime_ns) in plan order; returns a flag per file.
+        # Empty files and files that cannot be read are never duplicates.
+        in_batch = {}
+        for f in files:
+            if f[1]:
+                in_batch[f[1]] = in_batch.get(f[1], 0) + 1
+        new = {f[0] for f in files if f[1] and (in_batch[f[1]] > 1 or f[1] in self.by_size)}
+        partial, full = {}, {}
+        if new:
+            candidates = {}
+            for f in files:
+                if f[0] in new:
+                    candidates[f[0]] = f
+                    for g in self.by_size.get(f[1], ()):
+                        candidates.setdefault(g[0], g)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                partial = self._hash_all(pool, list(candidates.values()), False)
+                groups = {}
+                for p, f in candidates.items():
+                    if partial[p] is not None and f[1] > 2 * HASH_BLOCK:
+                        groups.setdefault((f[1], partial[p]), []).append(f)
+                collided = [f for group in groups.values()
+                            if len(group) > 1 and any(f[0] in new for f in group) for f in group]
+                full = self._hash_all(pool, collided, True)
+
+        def key(f):
+            p = f[0]
+            if partial.get(p) is None or (f[1] > 2 * HASH_BLOCK and full.get(p) is None):
+                return None
+            return f[1], partial[p], full.get(p)
+
+        known = {}
+        for p in partial:
+            if p not in new:
+                k = key(candidates[p])
+                if k is not None:
+                    known.setdefault(k, p)
+        flags = []
+        for f in files:
+            if f[1] is None:
+                flags.append(False)
+                continue
+            k = key(f) if f[0] in new else None
+            dup = k is not None and known.get(k, f[0]) != f[0]
+            flags.append(dup)
+            if not dup:
+                self.by_size.setdefault(f[1], []).append(f)
+                if k is not None:
+                    known.setdefault(k, f[0])
+        return flags
+
+    def moved(self, src: Path, dst: Path, size: int):
+        # keeps a moved file comparable (and its cached hashes usable) at its
+        # new path; a rename or verified copy keeps size and mtime
+        src, dst = os.fspath(src), os.fspath(dst)
+        files = self.by_size.get(size, [])
+        for i, f in enumerate(files):
+            if f[0] == src:
+                files[i] = (dst, f[1], f[2])
+                break
+        self.hashes.rename(src, dst)
+
+def content_index(target_dir: Path, categories, hash_cache=None, workers=4):
+    if hash_cache is not None and not hash_cache.loaded:
+        hash_cache.load()
+    index = ContentIndex(hash_cache, workers)
+    for cat in categories:
+        index.add_tree(target_dir / cat)
+    return index
+
+def claim_rows(rows, target_dir: Path, mode: str, registry=None, dedupe=None):
+    # rows of (src_dir, name, category, size, mtime_ns) become plan rows with a
+    # destination; with a ContentIndex, files whose content is already in the
+    # destination or earlier in the plan get None like a skipped duplicate
+    if dedupe is not None:
+        flags = dedupe.duplicates([(os.path.join(d, n), size, mtime_ns) for d, n, _, size, mtime_ns in rows])
+    else:
+        flags = [False] * len(rows)
+    out = []
+    for (src_dir, name, cat, size, mtime_ns), dup in zip(rows, flags):
+        if dup:
+            dst = None
+        elif registry is None:
+            dst = target_dir / cat / name
+        else:
+            dst = registry.claim(target_dir / cat, name, mode)
+        out.append((src_dir, name, cat, dst, size, mtime_ns))
+    return out
+
+def scan_preview(sources, target_dir: Path, classifier, batch_size=1000, cancel=None, workers=1,
+                 mode="Rename", registry=None, cache=None, hash_cache=None, rules=None, sniffer=None, stats=None):
+    # yields batches of (src_dir, name, category, dst, size, mtime_ns) rows.
+    # Entries are classified a batch at a time, which is what stats times as
+    # the "classify" phase.
+    classify = classifier.classify
+    if cache is not None and not cache.loaded:
+        cache.load()
+    dedupe = None
+    if mode == DEDUPE_MODE:
+        dedupe = content_index(target_dir, classifier.categories, hash_cache, max(2, workers))
+    roots = [src_dir for src_dir in sources if src_dir.exists()]
+    if rules is None:
+        rules = ScanRules(roots, destination_excludes(roots, target_dir, classifier.categories))
+    roots = [src_dir for src_dir in roots if not rules.excludes_root(src_dir)]
+    lister = rules.lister(None if cache is None else cache.list_dir)
+    if sniffer is not None and not sniffer.loaded:
+        sniffer.load()
+    if workers > 1:
+        prefetch = (lambda n: True) if sniffer is not None else (lambda n: classify(n) is not None)
+        entries = iter_files_parallel(roots, workers, cancel, prefetch, lister)
+    else:
+        entries = (entry for root in roots for entry in iter_files(root, cancel, lister))
+
+    def finish(entries):
+        if stats is not None:
+            stats.add(scanned=len(entries))
+        with stats.phase("classify") if stats is not None else nullcontext():
+            return classify_batch(entries)
+
+    def classify_batch(entries):
+        pending = []
+        for entry in entries:
+            cat = classify(entry.name)
+            if cat is not None or sniffer is not None:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    st = None
+                pending.append([entry.path, entry.name, cat, st])
+        if sniffer is not None:
+            wanted = [i for i, (_, _, cat, _) in enumerate(pending) if sniffer.wants(cat)]
+            cats = sniffer.categorize([(pending[i][0], pending[i][3], pending[i][2]) for i in wanted])
+            for i, cat in zip(wanted, cats):
+                pending[i][2] = cat
+        rows = []
+        for path, name, cat, st in pending:
+            if cat is None:
+                continue
+            try:
+                if st is None and dedupe is not None:
+                    # listing came from the scan cache, but dedupe needs sizes
+                    st = os.stat(path)
+            except OSError:
+                st = None
+            size, mtime_ns = (st.st_size, st.st_mtime_ns) if st is not None else (None, None)
+            rows.append((os.path.dirname(path), name, cat, size, mtime_ns))
+        return claim_rows(rows, target_dir, mode, registry, dedupe)
+
+    pending = []
+    for entry in entries:
+        pending.append(entry)
+        if len(pending) >= batch_size:
+            batch = finish(pending)
+            pending = []
+            if batch:
+                yield batch
+    if pending:
+        batch = finish(pending)
+        if batch:
+            yield batch
+
+class MovePlan:
+    # compact plan shared by the preview and the sort: directories and
+    # categories are interned, per-entry fields live in typed arrays, and the
+    # destination name is only stored when it differs from the source name
+    __slots__ = ("dirs", "dir_ids", "categories", "category_ids", "src_dirs", "names", "cats",
+                 "dst_dirs", "dst_names", "sizes", "mtimes")
+
+    def __init__(self):
+        self.dirs = []
+        self.dir_ids = {}
+        self.categories = []
+        self.category_ids = {}
+        self.src_dirs = array("I")
+        self.names = []
+        self.cats = array("H")
+        self.dst_dirs = array("i")
+        self.dst_names = {}
+        self.sizes = array("q")
+        self.mtimes = array("q")
+
+    def _dir_id(self, d: str):
+        i = self.dir_ids.get(d)
+        if i is None:
+            i = self.dir_ids[d] = len(self.dirs)
+            self.dirs.append(d)
+        return i
+
+    def append(self, src_dir: str, name: str, cat: str, dst, size=None, mtime_ns=None):
+        cat_id = self.category_ids.get(cat)
+        if cat_id is None:
+            cat_id = self.category_ids[cat] = len(self.categories)
+            self.categories.append(cat)
+        self.src_dirs.append(self._dir_id(src_dir))
+        self.names.append(name)
+        self.cats.append(cat_id)
+        if dst is None:
+            self.dst_dirs.append(-1)
+        else:
+            self.dst_dirs.append(self._dir_id(str(dst.parent)))
+            if dst.name != name:
+                self.dst_names[len(self.names) - 1] = dst.name
+        self.sizes.append(-1 if size is None else size)
+        self.mtimes.append(-1 if mtime_ns is None else mtime_ns)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(*row)
+
+    def __len__(self):
+        return len(self.names)
+
+    def src(self, i):
+        return Path(self.dirs[self.src_dirs[i]], self.names[i])
+
+    def category(self, i):
+        return self.categories[self.cats[i]]
+
+    def dst(self, i):
+        d = self.dst_dirs[i]
+        if d < 0:
+            return None
+        return Path(self.dirs[d], self.dst_names.get(i, self.names[i]))
+
+    def row(self, i):
+        return self.src(i), self.category(i), self.dst(i)
+
+    def __iter__(self):
+        for i in range(len(self.names)):
+            yield self.row(i)
+
+    def moves(self):
+        for i in range(len(self.names)):
+            size = self.sizes[i]
+            yield self.src(i), self.dst(i), (None if size < 0 else size), self.mtimes[i]
+
+    def replan(self, target_dir: Path, mode: str, registry):
+        plan = MovePlan()
+        for i in range(len(self.names)):
+            cat = self.category(i)
+            dst = registry.claim(target_dir / cat, self.names[i], mode)
+            size, mtime_ns = self.sizes[i], self.mtimes[i]
+            plan.append(self.dirs[self.src_dirs[i]], self.names[i], cat, dst,
+                        None if size < 0 else size, None if mtime_ns < 0 else mtime_ns)
+        return plan
+
+    def sort_key(self, column):
+        if column == "name":
+            return lambda i: self.names[i].lower()
+        if column == "category":
+            return lambda i: self.categories[self.cats[i]]
+        # directories are lowercased once, not per row
+        dirs = [d.lower() for d in self.dirs]
+        if column == "from":
+            return lambda i: (dirs[self.src_dirs[i]], self.names[i].lower())
+        dst_dirs, dst_names, names = self.dst_dirs, self.dst_names, self.names
+        return lambda i: ("", "") if dst_dirs[i] < 0 else (dirs[dst_dirs[i]], dst_names.get(i, names[i]).lower())
+
+def build_preview(sources, target_dir: Path, folder_lists: dict, selected_categories, classifier=None, workers=1,
+                  mode="Rename", registry=None, cache=None, hash_cache=None, rules=None, sniffer=None, stats=None,
+                  cancel=None):
+    if classifier is None:
+        classifier = ExtensionClassifier(folder_lists, selected_categories)
+    plan = MovePlan()
+    with stats.phase("scan") if stats is not None else nullcontext():
+        for batch in scan_preview(sources, target_dir, classifier, cancel=cancel, workers=workers, mode=mode,
+                                  registry=registry, cache=cache, hash_cache=hash_cache, rules=rules,
+                                  sniffer=sniffer, stats=stats):
+            plan.extend(batch)
+    cancelled = cancel is not None and cancel.is_set()
+    if cache is not None:
+        cache.save(() if cancelled else sources)
+    if sniffer is not None:
+        sniffer.save(complete=not cancelled)
+    if hash_cache is not None and mode == DEDUPE_MODE:
+        hash_cache.save()
+    return plan
+
+class RunStats:
+    # timings and counters for one run. Phases nest: time spent in an inner
+    # phase (classify inside scan) is not counted again in the outer one, and
+    # CPU time is recorded next to wall time, so a phase whose CPU share is
+    # low was waiting on the disk or the network rather than on the app.
+    # Counters are bumped from worker threads; progress() is a UI snapshot.
+    COUNTERS = ("scanned", "files", "bytes", "renames", "copies", "collisions", "skipped", "stale", "missing",
+                "errors")
+
+    def __init__(self, kind="sort"):
+        self.kind = kind
+        self.started = time.time()
+        self.finished = None
+        self.phases = {}
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+        self.total_files = 0
+        self.total_bytes = 0
+        self.sizes_known = True
+        self.stack = []
+        self.rate_start = None
+        self.rate_base = (0, 0)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start, start_cpu = time.perf_counter(), time.process_time()
+        with self.lock:
+            self.stack.append([name, 0.0, 0.0])
+            self.phases.setdefault(name, {"seconds": 0.0, "cpu_seconds": 0.0})
+            if name in ("move", "undo"):
+                self.rate_start = time.monotonic()
+                self.rate_base = (self._done(), self.counts["bytes"])
+        try:
+            yield self
+        finally:
+            wall, cpu = time.perf_counter() - start, time.process_time() - start_cpu
+            with self.lock:
+                _, child_wall, child_cpu = self.stack.pop()
+                p = self.phases[name]
+                p["seconds"] += wall - child_wall
+                p["cpu_seconds"] += cpu - child_cpu
+                if self.stack:
+                    self.stack[-1][1] += wall
+                    self.stack[-1][2] += cpu
+
+    def add(self, **counts):
+        with self.lock:
+            for key, n in counts.items():
+                self.counts[key] += n
+
+    def add_total(self, files: int, size=0, sized=True):
+        # sized=False: some of these files have no size, so total_bytes is short
+        # and the ETA has to go by the file rate
+        with self.lock:
+            self.total_files += files
+            self.total_bytes += size
+            self.sizes_known = self.sizes_known and sized
+
+    def add_plan(self, moves):
+        # totals for the progress bar, and names the registry already had to
+        # change as collisions
+        if isinstance(moves, MovePlan):
+            sizes, dst_dirs = moves.sizes, moves.dst_dirs
+            planned = [sizes[i] for i in range(len(moves)) if dst_dirs[i] >= 0]
+            self.add_total(len(moves), sum(n for n in planned if n > 0), all(n >= 0 for n in planned))
+            self.add(collisions=len(moves.dst_names))
+        else:
+            self.add_total(len(moves), sized=False)
+
+    def include(self, other):
+        # phases and scan counts of the preview that produced this run's plan
+        with self.lock:
+            for name, p in other.phases.items():
+                mine = self.phases.setdefault(name, {"seconds": 0.0, "cpu_seconds": 0.0})
+                mine["seconds"] += p["seconds"]
+                mine["cpu_seconds"] += p["cpu_seconds"]
+            self.counts["scanned"] += other.counts["scanned"]
+
+    def _done(self):
+        c = self.counts
+        return c["files"] + c["skipped"] + c["stale"] + c["missing"] + c["errors"]
+
+    def progress(self):
+        with self.lock:
+            phase = self.stack[-1][0] if self.stack else None
+            done, size = self._done(), self.counts["bytes"]
+            p = {"phase": phase, "done": done, "total": self.total_files, "bytes": size,
+                 "total_bytes": self.total_bytes, "scanned": self.counts["scanned"],
+                 "files_per_sec": None, "mb_per_sec": None, "eta": None}
+            if self.rate_start is None:
+                return p
+            elapsed = time.monotonic() - self.rate_start
+            files_done, bytes_done = done - self.rate_base[0], size - self.rate_base[1]
+        if elapsed > 0:
+            p["files_per_sec"] = files_done / elapsed
+            p["mb_per_sec"] = bytes_done / elapsed / 1e6
+            if self.sizes_known and self.total_bytes and bytes_done:
+                p["eta"] = max(0.0, (self.total_bytes - size) / (bytes_done / elapsed))
+            elif files_done:
+                p["eta"] = max(0.0, (self.total_files - done) / p["files_per_sec"])
+        return p
+
+    def finish(self):
+        self.finished = time.time()
+        return self
+
+    def to_dict(self):
+        with self.lock:
+            d = {"kind": self.kind, "started": self.started, "finished": self.finished,
+                 "phases": {name: {k: round(v, 6) for k, v in p.items()} for name, p in self.phases.items()},
+                 "counts": dict(self.counts), "total_files": self.total_files, "total_bytes": self.total_bytes}
+        for name in ("move", "undo"):
+            p = d["phases"].get(name)
+            if p and p["seconds"] > 0:
+                p["files_per_sec"] = round(d["counts"]["files"] / p["seconds"], 1)
+                p["mb_per_sec"] = round(d["counts"]["bytes"] / p["seconds"] / 1e6, 3)
+        return d
+
+    def save(self, path=RUN_STATS_FILE):
+        # one JSON object per run, appended
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.to_dict()) + "\n")
+        except OSError:
+            pass
+
+    def summary(self):
+        d = self.to_dict()
+        c = d["counts"]
+        parts = []
+        for name, p in d["phases"].items():
+            cpu = f", CPU {p['cpu_seconds'] / p['seconds'] * 100:.0f}%" if p["seconds"] > 0.05 else ""
+            parts.append(f"{name} {p['seconds']:.2f}s{cpu}")
+        return (f"Stats: {'; '.join(parts)}. {c['files']} file(s), {c['bytes'] / 1e6:.1f} MB, "
+                f"{c['renames']} rename(s), {c['copies']} copy(ies), {c['collisions']} collision(s), "
+                f"{c['skipped']} skipped, {c['errors']} error(s).")
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def format_progress(p):
+    if p["phase"] in ("scan", "classify") or (p["phase"] is None and not p["total"]):
+        return f"Scanning... {p['scanned']:,} file(s)"
+    text = f"{p['done']:,}/{p['total']:,} files"
+    if p["files_per_sec"] is not None:
+        text += f" · {p['files_per_sec']:,.0f} files/s · {p['mb_per_sec']:.1f} MB/s"
+    if p["eta"] is not None:
+        text += f" · ETA {format_duration(p['eta'])}"
+    return text
+
+def execute_moves(moves, mode: str, registry, journal, log, copy_workers=4, verify="size", last_moves=None,
+                  finish=True, stats=None, control=None, hash_cache=None):
+    # a cancelled run leaves its journal without an "end" record, so it shows
+    # up as interrupted and resume_sort picks up the files in counts["left"].
+    # Cached content hashes follow the moved files to their new paths.
+    counts = {"moved": 0, "skipped": 0, "stale": 0, "missing": 0, "error": 0}
+    if stats is not None:
+        stats.add_plan(moves)
+    if hash_cache is not None and not hash_cache.loaded:
+        hash_cache.load()
+
+    def on_result(status, src, dst, error):
+        counts[status] += 1
+        if stats is not None and status != "moved":
+            stats.add(**{"errors" if status == "error" else status: 1})
+        if status == "moved":
+            journal.record("done", src, dst)
+            if last_moves is not None:
+                last_moves.append((dst, src))
+            if hash_cache is not None:
+                hash_cache.rename(src, dst)
+            log(f"Moved: {src} → {dst}")
+        elif status == "skipped":
+            log(f"Skipped (duplicate): {src}")
+        elif status == "stale":
+            log(f"Skipped (changed since preview): {src}")
+        elif status == "error":
+            log(f"Error moving {src}: {error}")
+
+    try:
+        with stats.phase("move") if stats is not None else nullcontext():
+            move_plan(moves, mode, on_result, copy_workers, verify, registry, stats, control)
+        if control is not None and control.cancelled.is_set():
+            counts["left"] = len(moves) - sum(counts.values())
+        if finish and not counts.get("left"):
+            journal.write({"op": "end"}, sync=True)
+    finally:
+        if finish:
+            journal.close()
+        if hash_cache is not None and counts["moved"] and hash_cache.entries:
+            hash_cache.save()
+    if counts.get("left"):
+        log(f"Cancelled. Moved {counts['moved']} file(s); {counts['left']} left to resume.")
+        return counts
+    missing = counts["missing"]
+    stale = counts["stale"]
+    log(f"Done. Moved {counts['moved']} file(s)." + (f" Missing: {missing}." if missing else "")
+        + (f" Changed since preview: {stale}." if stale else ""))
+    return counts
+
+def sort_files(plan, target: Path, mode: str, registry, folder_lists: dict, log, copy_workers=4, verify="size",
+               last_moves=None, stats=None, control=None, hash_cache=None, journal_path=JOURNAL_FILE):
+    with stats.phase("folders") if stats is not None else nullcontext():
+        create_folders(target, folder_lists)
+    journal = MoveJournal(journal_path)
+    if journal.begin(target, mode):
+        for src, dst, _, _ in plan.moves():
+            if dst is not None:
+                journal.record("plan", src, dst)
+        # the whole plan is on disk before the first file moves
+        journal.sync()
+    else:
+        log(f"Could not open {journal_path}; this run cannot be undone after a restart.")
+    return execute_moves(plan, mode, registry, journal, log, copy_workers, verify, last_moves, stats=stats,
+                         control=control, hash_cache=hash_cache)
+
+def resume_sort(state, folder_lists: dict, log, copy_workers=4, verify="size", last_moves=None, stats=None,
+                control=None, hash_cache=None, journal_path=JOURNAL_FILE):
+    journal = MoveJournal(journal_path)
+    journal.open()
+    log("Resuming interrupted sort...")
+    with stats.phase("folders") if stats is not None else nullcontext():
+        create_folders(Path(state["target"]), folder_lists)
+    remaining = journal_remaining(state)
+    remove_partial_copies(dst for _, dst in remaining)
+    moves = []
+    for src, dst in remaining:
+        if not os.path.lexists(src) and os.path.lexists(dst):
+            # moved before the crash, but the "done" record was not synced
+            journal.record("done", src, dst)
+            if last_moves is not None:
+                last_moves.append((dst, src))
+            if hash_cache is not None:
+                hash_cache.rename(src, dst)
+        else:
+            moves.append((src, dst, None, None))
+    return execute_moves(moves, state["mode"], NameRegistry(), journal, log, copy_workers, verify, last_moves,
+                         stats=stats, control=control, hash_cache=hash_cache)
+
+def undo_moves(pairs, log, workers=4, verify="size", stats=None, control=None, leftovers=(), hash_cache=None,
+               journal_path=JOURNAL_FILE):
+    # leftovers are destinations of an interrupted sort that were never
+    # reached; .part files from a copy cut off there are removed as well
+    journal = MoveJournal(journal_path)
+    journal.open()
+    journal.write({"op": "undo"}, sync=True)
+    remove_partial_copies([old_path for _, old_path in pairs] + list(leftovers))
+    counts = {"restored": 0, "missing": 0, "error": 0}
+    if stats is not None:
+        stats.add_total(len(pairs), sized=False)
+    if hash_cache is not None and not hash_cache.loaded:
+        hash_cache.load()
+
+    def on_result(status, new_path, old_path, error):
+        counts[status] += 1
+        if stats is not None and status != "restored":
+            stats.add(**{"errors" if status == "error" else status: 1})
+        if status == "restored":
+            journal.record("undone", old_path, new_path)
+            if hash_cache is not None:
+                hash_cache.rename(new_path, old_path)
+            log(f"Restored: {new_path} → {old_path}")
+        elif status == "error":
+            log(f"Error restoring {new_path}: {error}")
+
+    try:
+        with stats.phase("undo") if stats is not None else nullcontext():
+            restore_moves(pairs, on_result, workers, verify, stats, control)
+        if control is not None and control.cancelled.is_set():
+            # pairs that ended at the same path count once in restore_moves
+            counts["left"] = len({new_path for new_path, _ in pairs}) - sum(counts.values())
+        if not counts.get("left"):
+            journal.write({"op": "undo_end"}, sync=True)
+    finally:
+        journal.close()
+        if hash_cache is not None and counts["restored"] and hash_cache.entries:
+            hash_cache.save()
+    if counts.get("left"):
+        log(f"Cancelled. Restored {counts['restored']} file(s); {counts['left']} left to restore.")
+    return counts
+
+def is_within(path: str, root: str):
+    path, root = os.path.normcase(path), os.path.normcase(root)
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+class PollingWatcher:
+    # portable fallback: stats every known directory each poll and only lists
+    # the ones whose mtime moved, reporting names it has not seen before
+    def __init__(self, roots, rules=None):
+        self.rules = rules
+        self.list_dir = list_dir if rules is None else rules.lister()
+        self.dirs = {}
+        for root in roots:
+            self._add_tree(os.fspath(root), None)
+
+    def _add_tree(self, top, out):
+        stack = [top]
+        while stack:
+            d = stack.pop()
+            if d in self.dirs or (self.rules is not None and self.rules.skip_dir(d)):
+                continue
+            try:
+                mtime_ns = os.stat(d).st_mtime_ns
+            except OSError:
+                continue
+            files, subdirs = self.list_dir(d)
+            names = {e.name for e in files}
+            if out is not None:
+                out.extend(e.path for e in files)
+            self.dirs[d] = (self._settled(mtime_ns), names)
+            stack.extend(subdirs)
+
+    @staticmethod
+    def _settled(mtime_ns):
+        # a directory changed within the last second may still gain entries
+        # under the same mtime, so it is relisted on the next poll
+        return mtime_ns if time.time_ns() - mtime_ns > 1_000_000_000 else -1
+
+    def poll(self, timeout):
+        time.sleep(timeout)
+        new = []
+        for d, (mtime_ns, names) in list(self.dirs.items()):
+            try:
+                current_mtime = os.stat(d).st_mtime_ns
+            except OSError:
+                del self.dirs[d]
+                continue
+            if current_mtime == mtime_ns:
+                continue
+            files, subdirs = self.list_dir(d)
+            current = {e.name for e in files}
+            new.extend(os.path.join(d, n) for n in current - names)
+            self.dirs[d] = (self._settled(current_mtime), current)
+            for sub in subdirs:
+                if sub not in self.dirs:
+                    self._add_tree(sub, new)
+        return new
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    # Linux inotify through ctypes, one watch per directory; new directories
+    # are watched as they appear and their existing files reported
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, roots, rules=None):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.ctypes = ctypes
+        self.rules = rules
+        self.list_dir = list_dir if rules is None else rules.lister()
+        self.roots = [os.fspath(r) for r in roots]
+        self.watches = {}
+        try:
+            for root in self.roots:
+                self._add_tree(root, None)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, top, out):
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        stack = [top]
+        while stack:
+            d = stack.pop()
+            if self.rules is not None and self.rules.skip_dir(d):
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(d), mask)
+            if wd < 0:
+                err = self.ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise OSError(err, "inotify watch limit reached")
+                continue
+            self.watches[wd] = d
+            files, subdirs = self.list_dir(d)
+            if out is not None:
+                out.extend(e.path for e in files)
+            stack.extend(subdirs)
+
+    def poll(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        new = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b"\0"))
+                offset += self.EVENT.size + length
+                if mask & self.IN_Q_OVERFLOW:
+                    # events were dropped: report every file under the roots and
+                    # let the caller's debounce/stale checks sort it out
+                    for root in self.roots:
+                        new.extend(entry.path for entry in iter_files(root, lister=self.list_dir))
+                    continue
+                if mask & self.IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                d = self.watches.get(wd)
+                if d is None or not name:
+                    continue
+                path = os.path.join(d, name)
+                if mask & self.IN_ISDIR:
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        self._add_tree(path, new)
+                elif self.rules is None or not self.rules.skip_file(path):
+                    new.append(path)
+        return new
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def open_watcher(roots, rules=None, use_inotify=True):
+    if use_inotify and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(roots, rules)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(roots, rules)
+
+def watch_sources(sources, target: Path, folder_lists: dict, selected_categories, mode: str, log, stop,
+                  settle=2.0, poll_interval=2.0, copy_workers=4, verify="size", use_inotify=True, last_moves=None,
+                  hash_cache=None, rules=None, sniffer=None, stats=None, journal_path=JOURNAL_FILE):
+    # sorts files that arrive after the watch starts. A file is moved once its
+    # size and mtime have not changed for `settle` seconds, it is not empty and
+    # no browser download of it is still in progress; the whole session
+    # is journalled as one run, starting with the first batch.
+    classifier = ExtensionClassifier(folder_lists, selected_categories)
+    roots = [os.path.abspath(src) for src in sources if src.exists()]
+    if rules is None:
+        rules = ScanRules(roots, destination_excludes(roots, target, folder_lists))
+    roots = [root for root in roots if not rules.excludes_root(root)]
+    watcher = open_watcher(roots, rules, use_inotify)
+    log(f"Watching {len(roots)} folder(s) using {'inotify' if isinstance(watcher, InotifyWatcher) else 'polling'}...")
+    registry = NameRegistry()
+    dedupe = content_index(target, classifier.categories, hash_cache, copy_workers) if mode == DEDUPE_MODE else None
+    journal = None
+    pending = {}
+    total = {"moved": 0, "error": 0}
+    try:
+        while not stop.is_set():
+            timeout = min(settle, poll_interval) / 2 if pending else poll_interval
+            for path in watcher.poll(timeout):
+                if path.lower().endswith(DOWNLOAD_SUFFIXES):
+                    continue
+                if sniffer is not None or classifier.classify(os.path.basename(path)) is not None:
+                    pending.setdefault(path, None)
+            now = time.monotonic()
+            ready = []
+            for path, last in list(pending.items()):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    del pending[path]
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    del pending[path]
+                    continue
+                sig = (st.st_size, st.st_mtime_ns)
+                if last is None or last[0] != sig:
+                    pending[path] = (sig, now)
+                elif now - last[1] >= settle:
+                    if not sig[0] or any(os.path.lexists(path + suffix) for suffix in DOWNLOAD_SUFFIXES):
+                        # still a placeholder, or being downloaded next to it
+                        pending[path] = (sig, now)
+                        continue
+                    del pending[path]
+                    name = os.path.basename(path)
+                    ready.append((os.path.dirname(path), name, classifier.classify(name), *sig))
+            if sniffer is not None and ready:
+                cats = sniffer.categorize([(os.path.join(d, n), None, cat) for d, n, cat, _, _ in ready])
+                ready = [(d, n, cat, size, mtime_ns) for (d, n, _, size, mtime_ns), cat in zip(ready, cats)
+                         if cat is not None]
+            if not ready:
+                continue
+            plan = MovePlan()
+            plan.extend(claim_rows(ready, target, mode, registry, dedupe))
+            if journal is None:
+                create_folders(target, folder_lists)
+                journal = MoveJournal(journal_path)
+                if not journal.begin(target, mode):
+                    log(f"Could not open {journal_path}; this session cannot be undone after a restart.")
+            for src, dst, _, _ in plan.moves():
+                if dst is not None:
+                    journal.record("plan", src, dst)
+            journal.sync()
+            moved = []
+            counts = execute_moves(plan, mode, registry, journal, log, copy_workers, verify, moved, finish=False,
+                                   stats=stats)
+            if dedupe is not None:
+                sizes = {src: size for src, _, size, _ in plan.moves()}
+                for dst, src in moved:
+                    dedupe.moved(src, dst, sizes[src])
+            if last_moves is not None:
+                last_moves.extend(moved)
+            total["moved"] += counts["moved"]
+            total["error"] += counts["error"]
+    finally:
+        watcher.close()
+        if hash_cache is not None and dedupe is not None:
+            hash_cache.save()
+        if sniffer is not None:
+            sniffer.save()
+        if journal is not None:
+            journal.write({"op": "end"}, sync=True)
+            journal.close()
+    log(f"Stopped watching. Moved {total['moved']} file(s).")
+    return total
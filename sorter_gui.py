@@ -0,0 +1,930 @@
+import customtkinter as ctk
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+from pathlib import Path
+from array import array
+import threading
+import queue
+import time
+
+from sorter_engine import (
+    DEDUPE_MODE, DUPLICATE_MODES, LogFile, MovePlan, NameRegistry, ExtensionClassifier, ScanCache, HashCache,
+    SNIFF_MODES, ScanRules, ContentSniffer, RunStats, RunControl, destination_excludes, format_duration,
+    format_progress,
+    load_settings, save_settings,
+    settings_values, scan_preview, build_preview, read_journal, journal_pending, journal_remaining, journal_leftovers,
+    journal_undo_pairs, sort_files, resume_sort, undo_moves, watch_sources,
+)
+
+try:
+    from tkinterdnd2 import DND_FILES
+    DND_AVAILABLE = True
+except Exception:
+    DND_AVAILABLE = False
+
+LOG_SCREEN_LINES = 5000
+PREVIEW_DRAIN_SECONDS = 0.03
+SNIFF_LABELS = ["Off", "Unknown files", "All files"]
+
+class FileSorterApp(ctk.CTk):
+    def __init__(self):
+        super().__init__()
+        self.title("File Sorter")
+        self.geometry("600x750")
+        self.resizable(False, False)
+        ctk.set_appearance_mode("dark")
+        ctk.set_default_color_theme("blue")
+
+        s = settings_values(load_settings())
+        self.folder_lists = s["folder_lists"]
+        self.source_paths = s["source_paths"]
+        self.destination_path = s["destination_path"]
+        self.selected_categories = s["selected_categories"]
+        self.duplicate_mode = s["duplicate_mode"]
+        self.scan_workers = s["scan_workers"]
+        self.copy_workers = s["copy_workers"]
+        self.verify_transfers = s["verify_transfers"]
+        self.use_scan_cache = s["scan_cache"]
+        self.ignore_patterns = s["ignore_patterns"]
+        self.max_depth = s["max_depth"]
+        self.follow_symlinks = s["follow_symlinks"]
+        self.sniff_content = s["sniff_content"]
+        self.max_files_per_sec = s["max_files_per_sec"]
+        self.max_mb_per_sec = s["max_mb_per_sec"]
+        self.sniffer = None
+        self.scan_cache = None
+        self.hash_cache = HashCache()
+        self.last_moves = []
+        self.classifier = None
+        self.log_queue = queue.SimpleQueue()
+        self.log_file = LogFile()
+        self.log_lines = 0
+        self.log_search_line = -1
+        self.preview_cancel = None
+        self.preview_plan = MovePlan()
+        self.preview_view = None
+        self.preview_sort = None
+        self.preview_offset = 0
+        self.preview_registry = None
+        self.preview_key = None
+        self.watch_stop = None
+        self.preview_stats = None
+        self.run_stats = None
+        self.run_control = None
+        self.run_thread = None
+        self.watch_thread = None
+
+        self.tabview = ctk.CTkTabview(self)
+        self.tabview.pack(fill="both", expand=True, padx=6, pady=6)
+
+        self.main_tab = self.tabview.add("Main")
+        self.preview_tab = self.tabview.add("Preview")
+        self.log_tab = self.tabview.add("Log")
+
+        self.build_main_tab()
+        self.build_preview_tab()
+        self.build_log_tab()
+        self.refresh_sources_listbox()
+        self.refresh_category_checks()
+        self.refresh_preview_table()
+        self.after(100, self.drain_log)
+        self.after(300, self.check_unfinished_run)
+
+        if DND_AVAILABLE:
+            try:
+                self.sources_listbox.drop_target_register(DND_FILES)
+                self.sources_listbox.dnd_bind("<<Drop>>", self.on_drop_sources)
+            except Exception:
+                pass
+
+    def build_main_tab(self):
+        src_frame = ctk.CTkFrame(self.main_tab)
+        src_frame.pack(fill="x", padx=6, pady=6)
+        ctk.CTkLabel(src_frame, text="Source Paths:").pack(anchor="w", padx=6, pady=4)
+
+        lb_frame = ctk.CTkFrame(src_frame)
+        lb_frame.pack(fill="x", padx=6, pady=4)
+        self.sources_listbox = tk.Listbox(lb_frame, selectmode=tk.EXTENDED, height=6, activestyle="none")
+        self.sources_listbox.pack(side="left", fill="both", expand=True, padx=(6, 0), pady=4)
+        src_scroll = ttk.Scrollbar(lb_frame, orient="vertical", command=self.sources_listbox.yview)
+        src_scroll.pack(side="right", fill="y", padx=(0, 6), pady=4)
+        self.sources_listbox.config(yscrollcommand=src_scroll.set)
+
+        hint = "Drag & drop folders here" if DND_AVAILABLE else "Add folders using the button"
+        ctk.CTkLabel(src_frame, text=hint, fg_color="transparent", text_color=("gray70", "gray70")).pack(anchor="w", padx=6)
+
+        btns = ctk.CTkFrame(self.main_tab)
+        btns.pack(fill="x", padx=6, pady=4)
+        ctk.CTkButton(btns, text="Add Folder", width=100, command=self.add_source_path).pack(side="left", padx=4)
+        ctk.CTkButton(btns, text="Remove Selected", width=130, command=self.delete_selected_sources).pack(side="left", padx=4)
+        ctk.CTkButton(btns, text="Clear", width=70, command=self.clear_sources).pack(side="left", padx=4)
+
+        dest = ctk.CTkFrame(self.main_tab)
+        dest.pack(fill="x", padx=6, pady=6)
+        ctk.CTkLabel(dest, text="Destination Path:").pack(anchor="w", padx=6)
+        self.dest_entry = ctk.CTkEntry(dest, width=360)
+        self.dest_entry.insert(0, str(self.destination_path))
+        self.dest_entry.pack(side="left", padx=6, pady=6)
+        ctk.CTkButton(dest, text="Browse", width=90, command=self.browse_destination).pack(side="left", padx=6)
+
+        dup_frame = ctk.CTkFrame(self.main_tab)
+        dup_frame.pack(fill="x", padx=6, pady=6)
+        ctk.CTkLabel(dup_frame, text="On duplicate:").pack(side="left", padx=6)
+        self.dup_option = ctk.CTkOptionMenu(dup_frame, values=DUPLICATE_MODES, width=140,
+                                            command=lambda _: self.save_all_settings())
+        self.dup_option.set(self.duplicate_mode)
+        self.dup_option.pack(side="left", padx=6)
+        ctk.CTkLabel(dup_frame, text="Scan threads:").pack(side="left", padx=6)
+        self.workers_option = ctk.CTkOptionMenu(dup_frame, values=["1", "2", "4", "8", "16", "32"], width=80,
+                                                command=lambda _: self.save_all_settings())
+        self.workers_option.set(str(self.scan_workers))
+        self.workers_option.pack(side="left", padx=6)
+
+        scan_frame = ctk.CTkFrame(self.main_tab)
+        scan_frame.pack(fill="x", padx=6, pady=6)
+        ctk.CTkLabel(scan_frame, text="Ignore:").pack(side="left", padx=6)
+        self.ignore_entry = ctk.CTkEntry(scan_frame, width=260, placeholder_text="comma-separated globs")
+        self.ignore_entry.insert(0, ", ".join(self.ignore_patterns))
+        self.ignore_entry.pack(side="left", padx=6)
+        ctk.CTkLabel(scan_frame, text="Max depth:").pack(side="left", padx=6)
+        self.depth_option = ctk.CTkOptionMenu(scan_frame, values=["Any", "0", "1", "2", "3", "5", "10"], width=80,
+                                              command=lambda _: self.save_all_settings())
+        self.depth_option.set("Any" if self.max_depth is None else str(self.max_depth))
+        self.depth_option.pack(side="left", padx=6)
+        ctk.CTkLabel(scan_frame, text="Sniff content:").pack(side="left", padx=6)
+        self.sniff_option = ctk.CTkOptionMenu(scan_frame, values=SNIFF_LABELS, width=120,
+                                              command=lambda _: self.save_all_settings())
+        self.sniff_option.set(SNIFF_LABELS[SNIFF_MODES.index(self.sniff_content)])
+        self.sniff_option.pack(side="left", padx=6)
+
+        cat_frame = ctk.CTkFrame(self.main_tab)
+        cat_frame.pack(fill="both", expand=False, padx=6, pady=6)
+        head = ctk.CTkFrame(cat_frame)
+        head.pack(fill="x")
+        ctk.CTkLabel(head, text="Select Categories:").pack(side="left", padx=6, pady=6)
+        ctk.CTkButton(head, text="Manage Categories", width=160, command=self.open_category_manager).pack(side="right", padx=6)
+
+        self.cat_scroll = ctk.CTkScrollableFrame(cat_frame, width=560, height=230)
+        self.cat_scroll.pack(fill="both", expand=True, padx=6, pady=6)
+        self.category_vars = {}
+
+        actions = ctk.CTkFrame(self.main_tab)
+        actions.pack(fill="x", padx=6, pady=8)
+        ctk.CTkButton(actions, text="Preview", width=100, command=self.refresh_preview_table).pack(side="left", padx=6)
+        ctk.CTkButton(actions, text="Sort Files", width=110, command=self.start_sorting_thread).pack(side="left", padx=6)
+        ctk.CTkButton(actions, text="Undo Last Run", width=140, command=self.undo_last_run).pack(side="left", padx=6)
+        self.watch_button = ctk.CTkButton(actions, text="Watch", width=120, command=self.toggle_watch)
+        self.watch_button.pack(side="left", padx=6)
+
+        progress = ctk.CTkFrame(self.main_tab)
+        progress.pack(fill="x", padx=6, pady=(0, 8))
+        self.progress_bar = ctk.CTkProgressBar(progress)
+        self.progress_bar.set(0)
+        self.progress_bar.pack(fill="x", padx=6, pady=(6, 2))
+        self.progress_label = ctk.CTkLabel(progress, text="", anchor="w")
+        self.progress_label.pack(side="left", fill="x", expand=True, padx=6)
+        ctk.CTkButton(progress, text="Cancel", width=80, command=self.cancel_run).pack(side="right", padx=6, pady=4)
+        self.pause_button = ctk.CTkButton(progress, text="Pause", width=80, command=self.toggle_pause)
+        self.pause_button.pack(side="right", padx=6, pady=4)
+
+    def build_preview_tab(self):
+        top = ctk.CTkFrame(self.preview_tab)
+        top.pack(fill="x", padx=6, pady=6)
+        ctk.CTkLabel(top, text="Preview of files to be moved").pack(side="left", padx=6)
+        ctk.CTkButton(top, text="Refresh", width=90, command=self.refresh_preview_table).pack(side="right", padx=6)
+        ctk.CTkButton(top, text="Cancel", width=80, command=self.cancel_preview).pack(side="right", padx=6)
+        self.preview_status = ctk.CTkLabel(top, text="")
+        self.preview_status.pack(side="right", padx=6)
+
+        view_bar = ctk.CTkFrame(self.preview_tab)
+        view_bar.pack(fill="x", padx=6)
+        ctk.CTkLabel(view_bar, text="Show category:").pack(side="left", padx=6)
+        self.preview_filter = ctk.CTkOptionMenu(view_bar, values=["All"], width=180,
+                                                command=lambda _: self.apply_preview_view())
+        self.preview_filter.set("All")
+        self.preview_filter.pack(side="left", padx=6, pady=4)
+
+        tree_frame = ctk.CTkFrame(self.preview_tab)
+        tree_frame.pack(fill="both", expand=True, padx=6, pady=6)
+
+        cols = ("name", "category", "from", "to")
+        self.preview_tree = ttk.Treeview(tree_frame, columns=cols, show="headings", height=18)
+        self.preview_tree.heading("name", text="Name", command=lambda: self.sort_preview("name"))
+        self.preview_tree.heading("category", text="Category", command=lambda: self.sort_preview("category"))
+        self.preview_tree.heading("from", text="From", command=lambda: self.sort_preview("from"))
+        self.preview_tree.heading("to", text="To", command=lambda: self.sort_preview("to"))
+        self.preview_tree.column("name", width=150, anchor="w")
+        self.preview_tree.column("category", width=110, anchor="w")
+        self.preview_tree.column("from", width=200, anchor="w")
+        self.preview_tree.column("to", width=200, anchor="w")
+        self.preview_tree.pack(side="left", fill="both", expand=True, padx=(6, 0), pady=6)
+
+        # the tree only ever holds one page of rows; the scrollbar and mouse
+        # wheel move a window over self.preview_view instead
+        self.preview_scroll = ttk.Scrollbar(tree_frame, orient="vertical", command=self.on_preview_scroll)
+        self.preview_scroll.pack(side="right", fill="y", padx=(0, 6), pady=6)
+        self.preview_tree.bind("<MouseWheel>", self.on_preview_wheel)
+        self.preview_tree.bind("<Button-4>", self.on_preview_wheel)
+        self.preview_tree.bind("<Button-5>", self.on_preview_wheel)
+
+    def build_log_tab(self):
+        tools = ctk.CTkFrame(self.log_tab)
+        tools.pack(fill="x", padx=6, pady=6)
+        ctk.CTkLabel(tools, text="Search:").pack(side="left", padx=6)
+        self.log_search = ctk.CTkEntry(tools, width=220)
+        self.log_search.pack(side="left", padx=6)
+        ctk.CTkButton(tools, text="Find Next", width=100, command=self.find_in_log).pack(side="left", padx=6)
+        ctk.CTkButton(tools, text="Clear Log", width=90, command=self.clear_log).pack(side="left", padx=6)
+        self.log_match = ctk.CTkLabel(self.log_tab, text="", anchor="w")
+        self.log_match.pack(side="bottom", fill="x", padx=6)
+
+        self.log_box = ctk.CTkTextbox(self.log_tab, wrap="none")
+        self.log_box.pack(fill="both", expand=True, padx=6, pady=6)
+        scroll = ctk.CTkScrollbar(self.log_tab, command=self.log_box.yview)
+        scroll.place(relx=1, rely=0.16, relheight=0.82, anchor="ne")
+        self.log_box.configure(yscrollcommand=scroll.set)
+
+    def on_drop_sources(self, event):
+        data = event.data
+        if not data:
+            return
+        paths = []
+        buf = ""
+        in_quote = False
+        for ch in data:
+            if ch == "{":
+                in_quote = True
+                buf = ""
+            elif ch == "}":
+                in_quote = False
+                paths.append(buf)
+                buf = ""
+            elif ch == " " and not in_quote:
+                if buf:
+                    paths.append(buf)
+                    buf = ""
+            else:
+                buf += ch
+        if buf:
+            paths.append(buf)
+        added = 0
+        for p in paths:
+            pth = Path(p)
+            if pth.exists() and pth.is_dir() and pth not in self.source_paths:
+                self.source_paths.append(pth)
+                added += 1
+        if added:
+            self.refresh_sources_listbox()
+            self.save_all_settings()
+
+    def refresh_sources_listbox(self):
+        self.sources_listbox.delete(0, "end")
+        for p in self.source_paths:
+            self.sources_listbox.insert("end", str(p))
+
+    def add_source_path(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            p = Path(folder)
+            if p not in self.source_paths:
+                self.source_paths.append(p)
+                self.refresh_sources_listbox()
+                self.save_all_settings()
+
+    def delete_selected_sources(self):
+        sel = list(self.sources_listbox.curselection())
+        if not sel:
+            return
+        for idx in reversed(sel):
+            del self.source_paths[idx]
+        self.refresh_sources_listbox()
+        self.save_all_settings()
+
+    def clear_sources(self):
+        if self.source_paths and messagebox.askyesno("Confirm", "Remove all source folders?"):
+            self.source_paths.clear()
+            self.refresh_sources_listbox()
+            self.save_all_settings()
+
+    def browse_destination(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.destination_path = Path(folder)
+            self.dest_entry.delete(0, "end")
+            self.dest_entry.insert(0, str(folder))
+            self.save_all_settings()
+
+    def refresh_category_checks(self):
+        for w in self.cat_scroll.winfo_children():
+            w.destroy()
+        self.category_vars.clear()
+        for cat in self.folder_lists.keys():
+            var = ctk.BooleanVar(value=(cat in self.selected_categories))
+            chk = ctk.CTkCheckBox(self.cat_scroll, text=cat, variable=var,
+                                  command=self.save_all_settings)
+            chk.pack(anchor="w", padx=8, pady=2)
+            self.category_vars[cat] = var
+
+    def open_category_manager(self):
+        win = ctk.CTkToplevel(self)
+        win.title("Manage Categories")
+        win.geometry("560x420")
+        win.resizable(False, False)
+
+        left = ctk.CTkFrame(win)
+        left.pack(side="left", fill="y", padx=8, pady=8)
+        right = ctk.CTkFrame(win)
+        right.pack(side="right", fill="both", expand=True, padx=8, pady=8)
+
+        lb = tk.Listbox(left, height=16)
+        lb.pack(side="left", fill="y", padx=(6, 0), pady=6)
+        sbar = ttk.Scrollbar(left, orient="vertical", command=lb.yview)
+        sbar.pack(side="right", fill="y", padx=(0, 6), pady=6)
+        lb.config(yscrollcommand=sbar.set)
+
+        for name in self.folder_lists.keys():
+            lb.insert("end", name)
+
+        form = ctk.CTkFrame(right)
+        form.pack(fill="x", padx=6, pady=6)
+        ctk.CTkLabel(form, text="Category Name").grid(row=0, column=0, sticky="w", padx=6, pady=6)
+        name_entry = ctk.CTkEntry(form, width=260)
+        name_entry.grid(row=0, column=1, padx=6, pady=6, sticky="w")
+
+        ctk.CTkLabel(form, text="Extensions (comma-separated)").grid(row=1, column=0, sticky="w", padx=6, pady=6)
+        ext_entry = ctk.CTkEntry(form, width=260)
+        ext_entry.grid(row=1, column=1, padx=6, pady=6, sticky="w")
+
+        btns = ctk.CTkFrame(right)
+        btns.pack(fill="x", padx=6, pady=6)
+        def refresh_lb():
+            lb.delete(0, "end")
+            for n in self.folder_lists.keys():
+                lb.insert("end", n)
+
+        def on_select(evt=None):
+            sel = lb.curselection()
+            if not sel:
+                name_entry.delete(0, "end")
+                ext_entry.delete(0, "end")
+                return
+            name = lb.get(sel[0])
+            exts = ", ".join(self.folder_lists.get(name, []))
+            name_entry.delete(0, "end")
+            name_entry.insert(0, name)
+            ext_entry.delete(0, "end")
+            ext_entry.insert(0, exts)
+
+        lb.bind("<<ListboxSelect>>", on_select)
+
+        def add_update():
+            name = name_entry.get().strip()
+            exts = [e.strip().lstrip(".").lower() for e in ext_entry.get().split(",") if e.strip()]
+            if not name or not exts:
+                return
+            self.folder_lists[name] = sorted(set(exts))
+            self.selected_categories.add(name)
+            self.classifier = None
+            self.scan_cache = None
+            refresh_lb()
+            self.refresh_category_checks()
+            self.save_all_settings()
+
+        def delete_cat():
+            sel = lb.curselection()
+            if not sel:
+                return
+            name = lb.get(sel[0])
+            if messagebox.askyesno("Delete", f"Delete category '{name}'?"):
+                self.folder_lists.pop(name, None)
+                self.selected_categories.discard(name)
+                self.classifier = None
+                self.scan_cache = None
+                refresh_lb()
+                name_entry.delete(0, "end")
+                ext_entry.delete(0, "end")
+                self.refresh_category_checks()
+                self.save_all_settings()
+
+        ctk.CTkButton(btns, text="Add / Update", command=add_update).pack(side="left", padx=6)
+        ctk.CTkButton(btns, text="Delete", fg_color="red", command=delete_cat).pack(side="left", padx=6)
+        ctk.CTkButton(btns, text="Close", command=win.destroy).pack(side="right", padx=6)
+
+    def refresh_preview_table(self):
+        self.cancel_preview()
+        selected = [c for c, v in self.category_vars.items() if v.get()]
+        self.selected_categories = set(selected)
+        target = Path(self.dest_entry.get()) if hasattr(self, "dest_entry") else self.destination_path
+        sources = list(self.source_paths)
+        classifier = self.get_classifier()
+        self.read_scan_options()
+        cache = self.get_scan_cache()
+        sniffer = self.get_sniffer()
+        rules = self.get_scan_rules(target)
+        workers = self.scan_workers
+        mode = self.dup_option.get()
+        registry = NameRegistry()
+        self.preview_registry = registry
+        self.preview_key = (str(target), mode)
+        self.preview_plan = MovePlan()
+        stats = RunStats("scan")
+        self.preview_stats = stats
+        self.preview_filter.configure(values=["All"] + [c for c in self.folder_lists if c in self.selected_categories])
+        if self.preview_filter.get() not in self.selected_categories:
+            self.preview_filter.set("All")
+        self.apply_preview_view()
+        cancel = threading.Event()
+        batches = queue.Queue()
+        self.preview_cancel = cancel
+        self.preview_status.configure(text="Scanning...")
+
+        def worker():
+            try:
+                with stats.phase("scan"):
+                    for batch in scan_preview(sources, target, classifier, cancel=cancel, workers=workers,
+                                              mode=mode, registry=registry, cache=cache, hash_cache=self.hash_cache,
+                                              rules=rules, sniffer=sniffer, stats=stats):
+                        batches.put(batch)
+                if cache is not None:
+                    cache.save(() if cancel.is_set() else sources)
+                if mode == DEDUPE_MODE:
+                    self.hash_cache.save()
+                if sniffer is not None:
+                    sniffer.save(complete=not cancel.is_set())
+            finally:
+                batches.put(None)
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.after(20, self.drain_preview, batches, cancel)
+
+    def drain_preview(self, batches, cancel):
+        if cancel is not self.preview_cancel:
+            return
+        plan = self.preview_plan
+        cat_filter = self.preview_filter.get()
+        done = more = False
+        # a fast scan can queue batches faster than they are taken in; each
+        # tick takes what fits in a few frames and leaves the rest for the next
+        deadline = time.monotonic() + PREVIEW_DRAIN_SECONDS
+        while True:
+            if time.monotonic() >= deadline:
+                more = True
+                break
+            try:
+                batch = batches.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                done = True
+                break
+            start = len(plan)
+            plan.extend(batch)
+            if self.preview_view is not None:
+                cat_id, cats = plan.category_ids.get(cat_filter), plan.cats
+                self.preview_view.extend(i for i in range(start, len(plan))
+                                         if cat_filter == "All" or cats[i] == cat_id)
+        if done:
+            self.preview_cancel = None
+            if self.preview_sort is not None:
+                self.apply_preview_view()
+            self.update_preview_status(" (cancelled)" if cancel.is_set() else "")
+            return
+        self.render_preview_window()
+        self.update_preview_status(prefix="Scanning... ")
+        self.after(1 if more else 50, self.drain_preview, batches, cancel)
+
+    def preview_view_len(self):
+        return len(self.preview_plan) if self.preview_view is None else len(self.preview_view)
+
+    def update_preview_status(self, suffix="", prefix=""):
+        text = f"{prefix}{len(self.preview_plan)} file(s)"
+        if self.preview_view is not None and self.preview_filter.get() != "All":
+            text += f", {len(self.preview_view)} shown"
+        self.preview_status.configure(text=text + suffix)
+
+    def apply_preview_view(self):
+        plan = self.preview_plan
+        cat_filter = self.preview_filter.get()
+        if cat_filter == "All" and self.preview_sort is None:
+            self.preview_view = None
+        else:
+            indices = range(len(plan))
+            if cat_filter != "All":
+                cat_id = plan.category_ids.get(cat_filter)
+                cats = plan.cats
+                indices = [i for i in indices if cats[i] == cat_id]
+            if self.preview_sort is not None:
+                column, reverse = self.preview_sort
+                indices = sorted(indices, key=plan.sort_key(column), reverse=reverse)
+            self.preview_view = array("I", indices)
+        self.preview_offset = 0
+        self.render_preview_window()
+        if self.preview_cancel is None:
+            self.update_preview_status()
+
+    def sort_preview(self, column):
+        if self.preview_sort is not None and self.preview_sort[0] == column:
+            self.preview_sort = None if self.preview_sort[1] else (column, True)
+        else:
+            self.preview_sort = (column, False)
+        self.apply_preview_view()
+
+    def render_preview_window(self):
+        page = int(self.preview_tree.cget("height"))
+        total = self.preview_view_len()
+        self.preview_offset = max(0, min(self.preview_offset, total - page))
+        self.preview_tree.delete(*self.preview_tree.get_children())
+        for k in range(self.preview_offset, min(self.preview_offset + page, total)):
+            src, cat, dst = self.preview_plan.row(k if self.preview_view is None else self.preview_view[k])
+            self.preview_tree.insert("", "end", values=(src.name, cat, str(src), str(dst) if dst else ""))
+        if total <= page:
+            self.preview_scroll.set(0, 1)
+        else:
+            self.preview_scroll.set(self.preview_offset / total, (self.preview_offset + page) / total)
+
+    def on_preview_scroll(self, action, amount, unit=None):
+        page = int(self.preview_tree.cget("height"))
+        if action == "moveto":
+            self.preview_offset = int(float(amount) * self.preview_view_len())
+        elif action == "scroll":
+            self.preview_offset += int(amount) * (page if unit == "pages" else 1)
+        self.render_preview_window()
+
+    def on_preview_wheel(self, event):
+        if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+            self.on_preview_scroll("scroll", -3, "units")
+        else:
+            self.on_preview_scroll("scroll", 3, "units")
+        return "break"
+
+    def cancel_preview(self):
+        if self.preview_cancel is not None:
+            self.preview_cancel.set()
+
+    def get_scan_cache(self):
+        if not self.use_scan_cache:
+            return None
+        if self.scan_cache is None:
+            self.scan_cache = ScanCache(self.folder_lists, follow_symlinks=self.follow_symlinks,
+                                        keep_all=self.sniff_content != "off")
+        return self.scan_cache
+
+    def get_scan_rules(self, target: Path):
+        return ScanRules(self.source_paths, destination_excludes(self.source_paths, target, self.folder_lists),
+                         self.ignore_patterns, self.max_depth, self.follow_symlinks)
+
+    def get_sniffer(self):
+        if self.sniff_content == "off":
+            return None
+        classifier = self.get_classifier()
+        if self.sniffer is None:
+            self.sniffer = ContentSniffer(classifier, self.sniff_content, max(4, self.scan_workers))
+        # sniffed extensions are cached, so only the category lookup follows the selection
+        self.sniffer.index = classifier.index
+        self.sniffer.mode = self.sniff_content
+        return self.sniffer
+
+    def get_classifier(self):
+        if self.classifier is None or self.classifier.categories != frozenset(self.selected_categories):
+            self.classifier = ExtensionClassifier(self.folder_lists, self.selected_categories)
+        return self.classifier
+
+    def append_log(self, text):
+        # safe from any thread: lines are queued and written out by drain_log
+        self.log_queue.put(text)
+
+    def drain_log(self):
+        self.flush_log()
+        self.after(100, self.drain_log)
+
+    def flush_log(self):
+        lines = []
+        while True:
+            try:
+                lines.append(self.log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not lines:
+            return
+        self.log_file.write_lines(lines)
+        shown = lines[-LOG_SCREEN_LINES:]
+        self.log_box.insert("end", "\n".join(shown) + "\n")
+        self.log_lines += len(shown)
+        if self.log_lines > LOG_SCREEN_LINES:
+            self.log_box.delete("1.0", f"{self.log_lines - LOG_SCREEN_LINES + 1}.0")
+            self.log_lines = LOG_SCREEN_LINES
+        self.log_box.see("end")
+
+    def clear_log(self):
+        self.log_box.delete("1.0", "end")
+        self.log_lines = 0
+
+    def find_in_log(self):
+        # searches the full log on disk, continuing after the previous match
+        needle = self.log_search.get().lower()
+        if not needle:
+            return
+        self.flush_log()
+        first = found = None
+        for n, line in enumerate(self.log_file.iter_lines()):
+            if needle in line.lower():
+                if first is None:
+                    first = (n, line)
+                if n > self.log_search_line:
+                    found = (n, line)
+                    break
+        found = found or first
+        if found is None:
+            self.log_match.configure(text="No match in the log file.")
+            return
+        self.log_search_line, line = found
+        message = line.split(" ", 2)[-1]
+        self.log_box.tag_remove("highlight", "1.0", "end")
+        idx = self.log_box.search(message, "end", backwards=True, stopindex="1.0")
+        if not idx:
+            self.log_match.configure(text=f"Line {found[0] + 1} (not on screen): {line}")
+            return
+        self.log_match.configure(text=f"Line {found[0] + 1}, logged {line[:19]}")
+        end_idx = f"{idx}+{len(message)}c"
+        self.log_box.tag_add("highlight", idx, end_idx)
+        self.log_box.tag_config("highlight", background="#444466")
+        self.log_box.mark_set(tk.INSERT, end_idx)
+        self.log_box.see(idx)
+
+    def start_sorting_thread(self):
+        if self.watch_running():
+            messagebox.showinfo("Watch", "Stop watching before starting a sort.")
+            return
+        if self.preview_cancel is not None:
+            messagebox.showinfo("Preview", "The preview is still scanning. Wait for it to finish or cancel it first.")
+            return
+        if self.run_busy() or self.run_pending():
+            return
+        self.save_all_settings()
+        target = Path(self.dest_entry.get())
+        mode = self.dup_option.get()
+        # destinations planned for another target or duplicate mode are redone
+        registry = self.preview_registry if self.preview_key == (str(target), mode) else None
+        self.start_run("sort", self.run_sorting, target, mode, self.preview_plan, registry)
+
+    def run_pending(self):
+        # an interrupted or cancelled run is resumed (or rolled back) from the
+        # journal before a sort or watch can start a new one over it
+        try:
+            pending = journal_pending(read_journal())
+        except OSError:
+            pending = None
+        if pending is None:
+            return False
+        self.check_unfinished_run()
+        return True
+
+    def watch_running(self):
+        # after Stop the watch thread still finishes its current batch and
+        # closes the journal; until then nothing else may start over it
+        return self.watch_stop is not None or (self.watch_thread is not None and self.watch_thread.is_alive())
+
+    def run_busy(self):
+        if self.run_control is None:
+            return False
+        messagebox.showinfo("Busy", "A run is in progress. Wait for it to finish or cancel it first.")
+        return True
+
+    def start_run(self, kind, worker, *args):
+        # runs worker(*args, stats, control) on a thread and follows it on the progress bar
+        stats = RunStats(kind)
+        control = RunControl(self.max_files_per_sec, self.max_mb_per_sec)
+        self.run_stats = stats
+        self.run_control = control
+        self.progress_bar.set(0)
+        self.pause_button.configure(text="Pause")
+        self.run_thread = threading.Thread(target=worker, args=(*args, stats, control), daemon=True)
+        self.run_thread.start()
+        self.after(250, self.update_progress, stats)
+
+    def toggle_pause(self):
+        control = self.run_control
+        if control is None:
+            return
+        if control.paused:
+            control.resume()
+            self.pause_button.configure(text="Pause")
+        else:
+            control.pause()
+            self.pause_button.configure(text="Resume")
+
+    def cancel_run(self):
+        # the run stops after the files in progress; a sort can then be resumed
+        if self.run_control is not None and not self.run_control.cancelled.is_set():
+            self.append_log("Cancelling after the files in progress...")
+            self.run_control.cancel()
+
+    def update_progress(self, stats):
+        if stats is not self.run_stats:
+            return
+        p = stats.progress()
+        if stats.finished is not None:
+            self.run_control = None
+            self.pause_button.configure(text="Pause")
+            self.progress_bar.set(p["done"] / p["total"] if p["total"] else 0)
+            self.progress_label.configure(
+                text=f"{stats.kind.capitalize()} finished in {format_duration(stats.finished - stats.started)}: "
+                     f"{p['done']:,} file(s), {p['bytes'] / 1e6:,.1f} MB")
+            return
+        control = self.run_control
+        self.progress_bar.set(p["done"] / p["total"] if p["total"] else 0)
+        text = format_progress(p)
+        if control.cancelled.is_set():
+            text = "Cancelling · " + text
+        elif control.paused:
+            text = "Paused · " + text
+        self.progress_label.configure(text=text)
+        self.after(250, self.update_progress, stats)
+
+    def close(self):
+        # a running sort is cancelled at its next checkpoint and a watch stops
+        # after its current batch before the window goes, so no file is left
+        # half-moved and a cancelled sort can be resumed later
+        self.cancel_run()
+        if self.watch_stop is not None:
+            self.watch_stop.set()
+        self.protocol("WM_DELETE_WINDOW", lambda: None)
+        self.close_when_idle()
+
+    def close_when_idle(self):
+        if any(t is not None and t.is_alive() for t in (self.run_thread, self.watch_thread)):
+            self.after(100, self.close_when_idle)
+            return
+        self.save_all_settings()
+        self.flush_log()
+        self.destroy()
+
+    def finish_run(self, stats):
+        stats.finish().save()
+        self.append_log(stats.summary())
+
+    def run_sorting(self, target: Path, mode: str, plan, registry, stats, control):
+        self.last_moves = []
+        self.append_log("Starting sort...")
+        if not len(plan) or (registry is None and mode == DEDUPE_MODE):
+            # content duplicates are only found by scanning, not by replanning
+            registry = NameRegistry()
+            plan = build_preview(self.source_paths, target, self.folder_lists, self.selected_categories,
+                                 self.get_classifier(), self.scan_workers, mode, registry, self.get_scan_cache(),
+                                 self.hash_cache, self.get_scan_rules(target), self.get_sniffer(), stats,
+                                 control.cancelled)
+            if control.cancelled.is_set():
+                self.append_log("Cancelled while scanning. Nothing was moved.")
+                self.finish_run(stats)
+                return
+        else:
+            # the preview's scan time belongs to this run
+            if self.preview_stats is not None:
+                stats.include(self.preview_stats)
+            if registry is None:
+                registry = NameRegistry()
+                plan = plan.replan(target, mode, registry)
+        try:
+            counts = sort_files(plan, target, mode, registry, self.folder_lists, self.append_log, self.copy_workers,
+                                self.verify_transfers, self.last_moves, stats, control, self.hash_cache)
+        finally:
+            self.finish_run(stats)
+        self.show_sort_result(counts)
+
+    def resume_run(self, state, stats, control):
+        try:
+            counts = resume_sort(state, self.folder_lists, self.append_log, self.copy_workers, self.verify_transfers,
+                                 self.last_moves, stats, control, self.hash_cache)
+        finally:
+            self.finish_run(stats)
+        self.show_sort_result(counts)
+
+    def show_sort_result(self, counts):
+        if counts.get("left"):
+            self.after(50, lambda: messagebox.showinfo(
+                "Cancelled", f"Sorting cancelled with {counts['left']} file(s) left.\n\n"
+                             "Press Sort Files to resume it or roll it back."))
+        else:
+            self.after(50, lambda: messagebox.showinfo("Completed", "File sorting completed!"))
+
+    def toggle_watch(self):
+        if self.watch_stop is not None:
+            self.watch_stop.set()
+            self.watch_stop = None
+            self.watch_button.configure(text="Watch")
+            return
+        if self.watch_running():
+            messagebox.showinfo("Watch", "Watching is still stopping. Try again in a moment.")
+            return
+        if self.run_busy() or self.run_pending():
+            return
+        self.save_all_settings()
+        stop = threading.Event()
+        self.watch_stop = stop
+        self.watch_button.configure(text="Stop Watching")
+        target = Path(self.dest_entry.get())
+        rules = self.get_scan_rules(target)
+        sniffer = self.get_sniffer()
+        args = (list(self.source_paths), target, self.folder_lists, set(self.selected_categories),
+                self.dup_option.get(), self.append_log, stop)
+        stats = RunStats("watch")
+
+        def worker():
+            try:
+                watch_sources(*args, copy_workers=self.copy_workers, verify=self.verify_transfers,
+                              last_moves=self.last_moves, hash_cache=self.hash_cache, rules=rules,
+                              sniffer=sniffer, stats=stats)
+            except Exception as e:
+                self.append_log(f"Watch stopped: {e}")
+                stop.set()
+            finally:
+                self.finish_run(stats)
+
+        self.watch_thread = threading.Thread(target=worker, daemon=True)
+        self.watch_thread.start()
+
+    def check_unfinished_run(self):
+        try:
+            state = read_journal()
+        except OSError:
+            return
+        pending = journal_pending(state)
+        if pending is None:
+            return
+        if pending == "undo":
+            pairs = journal_undo_pairs(state)
+            if pairs and messagebox.askyesno(
+                    "Unfinished undo", f"A previous undo was interrupted with {len(pairs)} file(s) not yet restored.\n\n"
+                                       "Finish restoring them now?"):
+                self.start_run("undo", self.run_undo, pairs, journal_leftovers(state))
+            return
+        remaining = journal_remaining(state)
+        answer = messagebox.askyesnocancel(
+            "Unfinished sort",
+            f"A previous sort was interrupted with {len(remaining)} of {len(state['planned'])} file(s) "
+            f"still to move.\n\nYes: resume it\nNo: roll it back\nCancel: decide later")
+        if answer:
+            self.start_run("resume", self.resume_run, state)
+        elif answer is False:
+            self.start_run("undo", self.run_undo, journal_undo_pairs(state), journal_leftovers(state))
+
+    def undo_last_run(self):
+        try:
+            state = read_journal()
+        except OSError:
+            state = None
+        if self.watch_running():
+            # restored files would land in watched folders and be sorted again
+            messagebox.showinfo("Watch", "Stop watching before undoing.")
+            return
+        if self.run_busy():
+            return
+        pairs = journal_undo_pairs(state) if state else list(self.last_moves)
+        if not pairs:
+            messagebox.showinfo("Undo", "Nothing to undo.")
+            return
+        self.start_run("undo", self.run_undo, pairs, journal_leftovers(state))
+
+    def run_undo(self, pairs, leftovers, stats, control):
+        try:
+            counts = undo_moves(pairs, self.append_log, self.copy_workers, self.verify_transfers, stats, control,
+                                leftovers, self.hash_cache)
+        finally:
+            self.finish_run(stats)
+        if counts.get("left"):
+            self.after(50, lambda: messagebox.showinfo(
+                "Undo", f"Undo cancelled with {counts['left']} file(s) left.\n\nPress Undo Last Run to finish it."))
+            return
+        self.last_moves.clear()
+        self.after(50, lambda: messagebox.showinfo("Undo", f"Undo complete. Restored {counts['restored']} file(s)."))
+
+    def save_all_settings(self):
+        self.selected_categories = {c for c, v in self.category_vars.items() if v.get()}
+        self.duplicate_mode = self.dup_option.get()
+        self.scan_workers = int(self.workers_option.get())
+        self.read_scan_options()
+        save_settings(self.source_paths, Path(self.dest_entry.get()), self.selected_categories, self.folder_lists,
+                      self.duplicate_mode, scan_workers=self.scan_workers, copy_workers=self.copy_workers,
+                      verify_transfers=self.verify_transfers, scan_cache=self.use_scan_cache,
+                      ignore_patterns=self.ignore_patterns, max_depth=self.max_depth,
+                      sniff_content=self.sniff_content)
+
+    def read_scan_options(self):
+        if not hasattr(self, "ignore_entry"):
+            return
+        self.ignore_patterns = [p.strip() for p in self.ignore_entry.get().split(",") if p.strip()]
+        depth = self.depth_option.get()
+        self.max_depth = None if depth == "Any" else int(depth)
+        sniff = SNIFF_MODES[SNIFF_LABELS.index(self.sniff_option.get())]
+        if sniff != self.sniff_content:
+            # the scan cache only keeps unmatched names while sniffing is on
+            self.scan_cache = None
+        self.sniff_content = sniff
+
+def main():
+    app = FileSorterApp()
+    app.protocol("WM_DELETE_WINDOW", app.close)
+    app.mainloop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import json
+
+from File_Organizer import EXIT_OK, EXIT_USAGE, main
+
+
+def test_sort_without_a_destination_is_a_usage_error(tmp_path, capsys):
+    settings = tmp_path / "settings.json"
+    settings.write_text(json.dumps({"source_paths": [str(tmp_path)]}))
+    assert main(["sort", "--settings", str(settings), "--dry-run"]) == EXIT_USAGE
+    assert "--dest" in capsys.readouterr().err
+    assert main(["sort", "--settings", str(settings), "--dry-run", "--dest", str(tmp_path / "out")]) == EXIT_OK
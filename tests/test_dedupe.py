@@ -0,0 +1,50 @@
+import sorter_engine
+from sorter_engine import (
+    DEDUPE_MODE, HashCache, NameRegistry, build_preview, default_folder_lists, journal_undo_pairs, read_journal,
+    sort_files, undo_moves,
+)
+
+
+def sort_once(sources, target, cache_file):
+    folder_lists = default_folder_lists()
+    hash_cache = HashCache(str(cache_file))
+    registry = NameRegistry()
+    plan = build_preview(sources, target, folder_lists, {"Documents"}, mode=DEDUPE_MODE, registry=registry,
+                         hash_cache=hash_cache)
+    return sort_files(plan, target, DEDUPE_MODE, registry, folder_lists, lambda text: None, hash_cache=hash_cache)
+
+
+def test_hash_cache_follows_moved_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    src, target, cache_file = tmp_path / "src", tmp_path / "dst", tmp_path / "hash_cache.json"
+    src.mkdir()
+    (src / "a.txt").write_bytes(b"a" * 100)
+    (src / "b.txt").write_bytes(b"b" * 100)
+    assert sort_once([src], target, cache_file)["moved"] == 2
+    cached = HashCache(str(cache_file)).load().entries
+    assert set(cached) == {str(target / "Documents" / "a.txt"), str(target / "Documents" / "b.txt")}
+
+    # the next run only hashes the new file; the destination's hashes are reused
+    (src / "c.txt").write_bytes(b"a" * 100)
+    hashed = []
+    real = sorter_engine.partial_checksum
+
+    def counting(path, size):
+        hashed.append(path)
+        return real(path, size)
+
+    monkeypatch.setattr(sorter_engine, "partial_checksum", counting)
+    counts = sort_once([src], target, cache_file)
+    assert counts["skipped"] == 1 and counts["moved"] == 0
+    assert hashed == [str(src / "c.txt")]
+
+
+def test_hash_cache_follows_undo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    src, target, cache_file = tmp_path / "src", tmp_path / "dst", tmp_path / "hash_cache.json"
+    src.mkdir()
+    (src / "a.txt").write_bytes(b"a" * 100)
+    (src / "b.txt").write_bytes(b"a" * 100)
+    sort_once([src], target, cache_file)
+    undo_moves(journal_undo_pairs(read_journal()), lambda text: None, hash_cache=HashCache(str(cache_file)))
+    assert set(HashCache(str(cache_file)).load().entries) == {str(src / "a.txt"), str(src / "b.txt")}
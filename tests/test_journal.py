@@ -0,0 +1,38 @@
+import json
+
+from sorter_engine import JOURNAL_FILE, journal_pending, journal_undo_pairs, read_journal
+
+
+def write_journal(tmp_path, records):
+    with open(tmp_path / JOURNAL_FILE, "w", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+    return read_journal(str(tmp_path / JOURNAL_FILE))
+
+
+def test_undo_with_everything_restored_is_finished(tmp_path):
+    # crashed after the last "undone" record, before "undo_end"
+    state = write_journal(tmp_path, [
+        {"op": "begin", "target": "/dst", "mode": "Rename"},
+        {"op": "plan", "src": "/src/a", "dst": "/dst/a"},
+        {"op": "done", "src": "/src/a", "dst": "/dst/a"},
+        {"op": "end"},
+        {"op": "undo"},
+        {"op": "undone", "src": "/src/a", "dst": "/dst/a"},
+    ])
+    assert journal_undo_pairs(state) == []
+    assert journal_pending(state) is None
+
+
+def test_undo_with_files_left_is_pending(tmp_path):
+    state = write_journal(tmp_path, [
+        {"op": "begin", "target": "/dst", "mode": "Rename"},
+        {"op": "plan", "src": "/src/a", "dst": "/dst/a"},
+        {"op": "plan", "src": "/src/b", "dst": "/dst/b"},
+        {"op": "done", "src": "/src/a", "dst": "/dst/a"},
+        {"op": "done", "src": "/src/b", "dst": "/dst/b"},
+        {"op": "undo"},
+        {"op": "undone", "src": "/src/a", "dst": "/dst/a"},
+    ])
+    assert journal_pending(state) == "undo"
+    assert [str(p) for p, _ in journal_undo_pairs(state)] == ["/dst/b"]
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import sorter_engine
+from sorter_engine import MovePlan, NameRegistry, build_preview, default_folder_lists, sort_files
+
+
+def make_sources(root: Path, sizes):
+    # one same-named file per source folder, each with its own byte pattern
+    sources = []
+    for i, size in enumerate(sizes):
+        src = root / f"src{i}"
+        src.mkdir()
+        (src / "movie.mkv").write_bytes(bytes([65 + i]) * size)
+        sources.append(src)
+    return sources
+
+
+def run_sort(sources, target, mode="Overwrite", copy_workers=4):
+    folder_lists = default_folder_lists()
+    registry = NameRegistry()
+    plan = build_preview(sources, target, folder_lists, {"Videos"}, mode=mode, registry=registry)
+    return sort_files(plan, target, mode, registry, folder_lists, lambda text: None, copy_workers)
+
+
+def test_overwrite_same_name_last_source_wins(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sources = make_sources(tmp_path, [3000, 2000, 1000])
+    target = tmp_path / "dst"
+    counts = run_sort(sources, target)
+    assert counts["moved"] == 3 and counts["error"] == 0
+    assert (target / "Videos" / "movie.mkv").read_bytes() == b"C" * 1000
+    assert not any((src / "movie.mkv").exists() for src in sources)
+
+
+def test_overwrite_copies_to_one_name_never_overlap(tmp_path, monkeypatch):
+    other = Path("/dev/shm")
+    if not other.is_dir() or os.stat(other).st_dev == os.stat(tmp_path).st_dev:
+        pytest.skip("needs a second filesystem for cross-device copies")
+    monkeypatch.chdir(tmp_path)
+    sources = make_sources(tmp_path, [150_000, 100_000, 50_000])
+    active, overlaps = set(), []
+    lock = threading.Lock()
+    real_transfer = sorter_engine.transfer_file
+
+    def slow_transfer(src, dst, verify="size", overwrite=False):
+        with lock:
+            if dst in active:
+                overlaps.append(dst)
+            active.add(dst)
+        try:
+            time.sleep(0.05)
+            return real_transfer(src, dst, verify, overwrite)
+        finally:
+            with lock:
+                active.discard(dst)
+
+    monkeypatch.setattr(sorter_engine, "transfer_file", slow_transfer)
+    with tempfile.TemporaryDirectory(dir=other) as d:
+        target = Path(d)
+        counts = run_sort(sources, target, copy_workers=4)
+        assert overlaps == []
+        assert counts["moved"] == 3 and counts["error"] == 0
+        assert (target / "Videos" / "movie.mkv").read_bytes() == b"C" * 50_000
+    assert not any((src / "movie.mkv").exists() for src in sources)
+
+
+def test_sort_by_destination_puts_skipped_rows_first():
+    plan = MovePlan()
+    plan.append("/src", "b.mkv", "Videos", Path("/dst/Videos/b.mkv"))
+    plan.append("/src", "skip.mkv", "Videos", None)
+    plan.append("/src", "a.mkv", "Videos", Path("/dst/Videos/Z_1.mkv"))
+    plan.append("/src", "c.pdf", "Documents", Path("/dst/Documents/c.pdf"))
+    order = sorted(range(len(plan)), key=plan.sort_key("to"))
+    assert [plan.names[i] for i in order] == ["skip.mkv", "c.pdf", "b.mkv", "a.mkv"]
@@ -0,0 +1,26 @@
+from sorter_engine import build_preview, default_folder_lists
+
+
+def preview_sources(sources, target):
+    plan = build_preview(sources, target, default_folder_lists(), {"Documents"})
+    return sorted(src.name for src, _, _ in plan)
+
+
+def test_destination_below_a_source_is_not_scanned(tmp_path):
+    src = tmp_path / "Downloads"
+    (src / "Sorted" / "Documents").mkdir(parents=True)
+    (src / "Sorted" / "loose.pdf").write_text("x")
+    (src / "Sorted" / "Documents" / "sorted.pdf").write_text("x")
+    (src / "new.pdf").write_text("x")
+    assert preview_sources([src], src / "Sorted") == ["new.pdf"]
+
+
+def test_source_inside_the_destination_is_scanned(tmp_path):
+    target = tmp_path / "Stuff"
+    (target / "Documents").mkdir(parents=True)
+    (target / "Inbox").mkdir()
+    (target / "Documents" / "sorted.pdf").write_text("x")
+    (target / "Inbox" / "new.pdf").write_text("x")
+    assert preview_sources([target / "Inbox"], target) == ["new.pdf"]
+    # the destination as a source still skips its category folders
+    assert preview_sources([target], target) == ["new.pdf"]
@@ -0,0 +1,31 @@
+from sorter_engine import SNIFF_GENERIC, sniff_extension
+
+
+def mp3_frames(count):
+    # MPEG-1 Layer III, 128 kbit/s, 44.1 kHz: 417-byte frames
+    frame = b"\xff\xfb\x90\x00" + bytes(413)
+    return frame * count
+
+
+def test_utf16_text_is_not_audio():
+    assert sniff_extension(b"\xff\xfe" + "hello".encode("utf-16-le")) == "txt"
+    assert sniff_extension(b"\xfe\xff" + "hello".encode("utf-16-be")) == "txt"
+    assert "txt" in SNIFF_GENERIC
+
+
+def test_mpeg_frames_need_a_valid_header_and_a_second_sync():
+    assert sniff_extension(mp3_frames(2)[:512]) == "mp3"
+    # bitrate index 15 is invalid
+    assert sniff_extension(b"\xff\xfb\xf0\x00" + bytes(508)) is None
+    # sample-rate index 3 is reserved
+    assert sniff_extension(b"\xff\xfb\x9c\x00" + bytes(508)) is None
+    # a valid header followed by something that is not a frame
+    assert sniff_extension(mp3_frames(1) + b"not a frame" + bytes(84)) is None
+    assert "mp3" in SNIFF_GENERIC and "aac" in SNIFF_GENERIC
+
+
+def test_adts_aac():
+    # ADTS, 44.1 kHz, 100-byte frames
+    header = bytes([0xFF, 0xF1, 0x50, 0x80, 100 >> 3, (100 & 7) << 5 | 0x1F, 0xFC])
+    frame = header + bytes(100 - len(header))
+    assert sniff_extension((frame * 6)[:512]) == "aac"
@@ -0,0 +1,33 @@
+from pathlib import Path
+
+from sorter_engine import MovePlan, RunStats
+
+
+def plan_with_sizes(*sizes):
+    plan = MovePlan()
+    for i, size in enumerate(sizes):
+        plan.append("/src", f"f{i}.bin", "Videos", Path("/dst/Videos", f"f{i}.bin"), size)
+    return plan
+
+
+def test_eta_uses_the_file_rate_when_a_size_is_unknown(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("sorter_engine.time.monotonic", lambda: now[0])
+    stats = RunStats()
+    stats.add_plan(plan_with_sizes(1000, None, None, None))
+    with stats.phase("move"):
+        now[0] += 10
+        stats.add(files=1, bytes=1000)
+        # one of four files in 10s; by bytes it would look finished
+        assert stats.progress()["eta"] == 30.0
+
+
+def test_eta_uses_the_byte_rate_when_all_sizes_are_known(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("sorter_engine.time.monotonic", lambda: now[0])
+    stats = RunStats()
+    stats.add_plan(plan_with_sizes(1000, 3000))
+    with stats.phase("move"):
+        now[0] += 10
+        stats.add(files=1, bytes=1000)
+        assert stats.progress()["eta"] == 30.0
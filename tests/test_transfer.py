@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+import sorter_engine
+from sorter_engine import (
+    MoveJournal, default_folder_lists, journal_leftovers, journal_undo_pairs, partial_path, read_journal,
+    resume_sort, transfer_file, undo_moves,
+)
+
+
+def test_transfer_never_replaces_existing_without_overwrite(tmp_path):
+    src, dst = tmp_path / "a.bin", tmp_path / "b.bin"
+    src.write_bytes(b"new")
+    dst.write_bytes(b"old")
+    with pytest.raises(FileExistsError):
+        transfer_file(src, dst)
+    assert dst.read_bytes() == b"old" and src.exists()
+    assert not partial_path(dst).exists()
+    transfer_file(src, dst, overwrite=True)
+    assert dst.read_bytes() == b"new" and not src.exists()
+
+
+def test_destination_folder_is_synced_before_the_source_goes(tmp_path, monkeypatch):
+    src, dst = tmp_path / "a.bin", tmp_path / "out" / "b.bin"
+    src.write_bytes(b"data")
+    dst.parent.mkdir()
+    synced = []
+    monkeypatch.setattr(sorter_engine, "fsync_dir", lambda path: synced.append((path, src.exists(), dst.exists())))
+    transfer_file(src, dst)
+    assert synced == [(dst.parent, True, True)]
+    assert not src.exists()
+
+
+def test_failed_copy_leaves_no_file_at_destination(tmp_path, monkeypatch):
+    src, dst = tmp_path / "a.bin", tmp_path / "b.bin"
+    src.write_bytes(b"x" * 1000)
+
+    def broken_copy(fsrc, fdst, size):
+        fdst.write(b"x" * 10)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(sorter_engine, "copy_file_data", broken_copy)
+    with pytest.raises(OSError):
+        transfer_file(src, dst)
+    assert os.listdir(tmp_path) == ["a.bin"]
+
+
+def crashed_sort(tmp_path):
+    # a journal with only the "plan" record and a copy cut off mid-way
+    src = tmp_path / "src" / "big.mkv"
+    src.parent.mkdir()
+    src.write_bytes(b"v" * 5000)
+    target = tmp_path / "dst"
+    dst = target / "Videos" / "big.mkv"
+    journal = MoveJournal()
+    journal.begin(target, "Rename")
+    journal.record("plan", src, dst)
+    journal.close()
+    dst.parent.mkdir(parents=True)
+    dst.with_name(".big.mkv.part-99999").write_bytes(b"v" * 1000)
+    return src, dst
+
+
+def test_resume_removes_partial_copies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    src, dst = crashed_sort(tmp_path)
+    counts = resume_sort(read_journal(), default_folder_lists(), lambda text: None)
+    assert counts["moved"] == 1 and not src.exists()
+    assert os.listdir(dst.parent) == ["big.mkv"] and dst.read_bytes() == b"v" * 5000
+
+
+def test_rollback_removes_partial_copies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    src, dst = crashed_sort(tmp_path)
+    state = read_journal()
+    undo_moves(journal_undo_pairs(state), lambda text: None, leftovers=journal_leftovers(state))
+    assert os.listdir(dst.parent) == [] and src.read_bytes() == b"v" * 5000
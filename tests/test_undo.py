@@ -0,0 +1,20 @@
+from sorter_engine import undo_moves
+
+
+def test_undo_never_replaces_a_file_at_the_original_path(tmp_path):
+    # two downloads of report.pdf were sorted at different times; both
+    # restore to src/report.pdf and neither may be lost
+    src, docs = tmp_path / "src", tmp_path / "Documents"
+    src.mkdir()
+    docs.mkdir()
+    (docs / "report.pdf").write_text("first")
+    (docs / "report_1.pdf").write_text("second")
+    (src / "report.pdf").write_text("new download")
+    pairs = [
+        (docs / "report.pdf", src / "report.pdf"),
+        (docs / "report_1.pdf", src / "report.pdf"),
+    ]
+    counts = undo_moves(pairs, lambda msg: None, journal_path=str(tmp_path / "journal.jsonl"))
+    assert counts["restored"] == 2
+    assert sorted(p.read_text() for p in src.iterdir()) == ["first", "new download", "second"]
+    assert list(docs.iterdir()) == []
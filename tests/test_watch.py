@@ -0,0 +1,38 @@
+import threading
+import time
+
+from sorter_engine import default_folder_lists, watch_sources
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_watch_waits_for_a_browser_download_to_finish(tmp_path):
+    src, target = tmp_path / "Downloads", tmp_path / "Sorted"
+    src.mkdir()
+    stop = threading.Event()
+    logs = []
+    watcher = threading.Thread(target=watch_sources, args=(
+        [src], target, default_folder_lists(), {"Documents"}, "Rename", logs.append, stop),
+        kwargs={"settle": 0.2, "poll_interval": 0.1, "use_inotify": False,
+                "journal_path": str(tmp_path / "journal.jsonl")})
+    watcher.start()
+    try:
+        assert wait_for(lambda: logs)
+        # Firefox: an empty placeholder, the data in report.pdf.part
+        (src / "report.pdf").write_bytes(b"")
+        (src / "report.pdf.part").write_bytes(b"%PDF-1.4 partial")
+        time.sleep(1.0)
+        assert (src / "report.pdf").exists() and (src / "report.pdf.part").exists()
+        (src / "report.pdf.part").replace(src / "report.pdf")
+        assert wait_for(lambda: (target / "Documents" / "report.pdf").exists())
+        assert (target / "Documents" / "report.pdf").read_bytes() == b"%PDF-1.4 partial"
+    finally:
+        stop.set()
+        watcher.join()